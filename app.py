@@ -30,7 +30,7 @@ os.makedirs('logs', exist_ok=True)
 
 # 配置日志系统
 def setup_logging():
-    """配置日志系统"""
+    """配置日志系统 - 调用线程只把日志放入队列，由单独的线程写文件和控制台，不阻塞下载和请求处理"""
     log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     
     # 创建文件处理器，限制每个文件10MB，保留5个备份
@@ -47,10 +47,10 @@ def setup_logging():
     console_handler.setFormatter(logging.Formatter(log_format))
     
     # 配置根日志器
+    from services.log_pipeline import start as start_log_pipeline
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    start_log_pipeline(logger, [file_handler, console_handler])
     
     return logger
 
@@ -145,6 +145,10 @@ except ImportError as e:
             ]
         })
 
+# ETag/304、响应压缩和带内容指纹的静态文件
+from services.http_cache import init_app as init_http_cache
+init_http_cache(app)
+
 @app.route('/')
 def index():
     """首页"""
@@ -154,8 +158,9 @@ def index():
         config = get_config()
         interfaces = ['enp2s0', 'enp3s0', 'NodeBabyLink']  # 使用修复后的接口列表
         
-        logger.info(f"首页渲染，配置: {config}")
-        logger.info(f"网卡列表: {interfaces}")
+        # 每次打开页面都会执行，配置中含完整URL列表，只在调试级别记录
+        logger.debug(f"首页渲染，配置: {config}")
+        logger.debug(f"网卡列表: {interfaces}")
         
         return render_template('index.html', 
                               interfaces=interfaces,
@@ -213,16 +218,45 @@ def init_app():
     except Exception as e:
         logger.error(f"初始化错误: {e}")
 
+def shutdown_services():
+    """停止下载和采样线程，保存账本、流量历史、计费统计和配置"""
+    try:
+        from services.downonly_service import downonly_service
+        downonly_service.shutdown()
+        from services.monitor_service import monitor_service
+        monitor_service.shutdown()
+        from services.config_service import flush
+        flush()
+        logger.info("后台服务已停止")
+    except Exception as e:
+        logger.error(f"停止后台服务错误: {e}")
+
+def parse_args():
+    import argparse
+    parser = argparse.ArgumentParser(description="Smart Network Tool")
+    parser.add_argument("port", nargs="?", type=int, default=8080)
+    parser.add_argument("--dev", action="store_true", help="使用Flask开发服务器")
+    parser.add_argument("--workers", type=int, default=16, help="HTTP工作线程数")
+    parser.add_argument("--queue-size", type=int, default=64, help="等待处理的连接数上限，超出返回503")
+    parser.add_argument("--request-timeout", type=float, default=30, help="单个请求读写超时（秒）")
+    return parser.parse_args()
+
 if __name__ == '__main__':
+    args = parse_args()
     init_app()
-    
-    # 获取端口参数
-    port = 8080
-    if len(sys.argv) > 1:
-        try:
-            port = int(sys.argv[1])
-        except:
-            pass
+    port = args.port
     
     logger.info(f"Smart Network Tool 已启动 → http://0.0.0.0:{port}")
-    app.run(host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    if args.dev:
+        app.run(host='0.0.0.0', port=port, debug=False)
+    else:
+        from services.wsgi_server import serve
+        from services.event_stream import event_broadcaster
+        # 每个推送连接长期占用一个工作线程，最多用一半的线程，其余留给普通请求
+        event_broadcaster.max_subscribers = max(1, args.workers // 2)
+        serve(app, '0.0.0.0', port,
+              workers=args.workers,
+              queue_size=args.queue_size,
+              request_timeout=args.request_timeout,
+              on_stopping=event_broadcaster.close,
+              on_shutdown=shutdown_services)
\ No newline at end of file
@@ -1,8 +1,11 @@
 """DownOnly路由 - 修复版"""
 
 from flask import Blueprint, jsonify, request
-from services.downonly_service import toggle_service as toggle_downonly, get_status, get_history
-from services.config_service import get_config, save_config, update_config
+from services.downonly_service import (toggle_service as toggle_downonly, get_status, get_history,
+                                      get_history_version, get_sources)
+from services.config_service import (get_config, get_version as get_config_version, get_write_error,
+                                     save_config, update_config)
+from services.http_cache import not_modified, cached_json
 
 downonly_bp = Blueprint('downonly', __name__, url_prefix='/api/downonly')
 
@@ -32,8 +35,20 @@ def get_history_route():
     """获取月度历史"""
     try:
         month = request.args.get('month', 2, type=int)
-        history = get_history(month)
-        return jsonify(history)
+        version = get_history_version(month)
+        response = not_modified(version)
+        if response is not None:
+            return response
+        return cached_json(get_history(month), version)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@downonly_bp.route('/sources')
+def get_sources_route():
+    """获取下载源健康评分"""
+    try:
+        return jsonify(get_sources())
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -46,18 +61,22 @@ def config_route():
             new_config = request.json
             result = update_config(new_config)
             if result:
-                # 配置保存成功后，通知流量黑洞服务更新URL列表
-                try:
-                    downonly_service.update_urls_from_config()
-                    print("流量黑洞服务URL列表已更新")
-                except Exception as e:
-                    print(f"通知流量黑洞服务失败: {e}")
+                # 流量黑洞服务订阅了配置变化，保存后自动应用
                 return jsonify({"ok": True})
             else:
-                return jsonify({"error": "保存配置失败"}), 500
+                error = get_write_error()
+                return jsonify({"error": f"保存配置失败: {error}" if error else "保存配置失败"}), 500
         else:
+            # 配置文件延迟写入，POST返回时可能还未写入；写入失败的原因随配置返回，由页面提示
+            write_error = get_write_error()
+            version = (get_config_version(), write_error)
+            response = not_modified(version)
+            if response is not None:
+                return response
             config = get_config()
-            return jsonify(config)
+            if write_error:
+                config["write_error"] = write_error
+            return cached_json(config, version)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -0,0 +1,46 @@
+"""实时推送路由 - Server-Sent Events"""
+
+from flask import Blueprint, Response, jsonify, stream_with_context
+from services.event_stream import event_broadcaster, live_publisher, CLOSED
+
+events_bp = Blueprint('events', __name__, url_prefix='/api')
+
+HEARTBEAT_SECONDS = 15
+
+
+@events_bp.route('/events')
+def events_route():
+    """网卡统计和流量黑洞状态的SSE推送流
+
+    事件: stats（每秒，所有网卡）、downonly（变化的状态字段，连接时先发送完整状态）
+    推送连接数已达上限时返回503，客户端退回轮询。
+    """
+    subscriber = event_broadcaster.subscribe()
+    if subscriber is None:
+        response = jsonify({"error": "推送连接数已达上限"})
+        response.headers['Retry-After'] = '30'
+        return response, 503
+
+    def stream():
+        # 断线后浏览器3秒重连
+        yield "retry: 3000\n\n"
+        for event, data in live_publisher.snapshot():
+            yield event_broadcaster.format_event(event, data)
+        while True:
+            if subscriber.resync:
+                subscriber.resync = False
+                for event, data in live_publisher.snapshot():
+                    yield event_broadcaster.format_event(event, data)
+            message = subscriber.next(timeout=HEARTBEAT_SECONDS)
+            if message is CLOSED:
+                break
+            # 注释行作为心跳，保持连接并及时发现已断开的客户端
+            yield message if message is not None else ": ping\n\n"
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 连接结束（包括响应体尚未开始发送就断开）时取消订阅
+    response.call_on_close(lambda: event_broadcaster.unsubscribe(subscriber))
+    return response
@@ -1,7 +1,9 @@
 """网卡监测路由 - 修复版"""
 
-from flask import Blueprint, jsonify
-from services.monitor_service import get_interfaces, get_stats, get_history
+from flask import Blueprint, jsonify, request
+from services.monitor_service import (get_interfaces, get_interfaces_version, get_stats, get_all_stats,
+                                     get_history, get_history_version, get_usage)
+from services.http_cache import not_modified, cached_json
 
 monitor_bp = Blueprint('monitor', __name__, url_prefix='/api/monitor')
 
@@ -10,8 +12,21 @@ monitor_bp = Blueprint('monitor', __name__, url_prefix='/api/monitor')
 def get_interfaces_route():
     """获取网卡列表"""
     try:
-        interfaces = get_interfaces()
-        return jsonify(interfaces)
+        version = get_interfaces_version()
+        response = not_modified(version)
+        if response is not None:
+            return response
+        return cached_json(get_interfaces(), version)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@monitor_bp.route('/stats')
+def get_all_stats_route():
+    """批量获取网卡实时统计 - ?interfaces=eth0,eth1 指定子集，默认所有监测的网卡"""
+    try:
+        interfaces = [name for name in request.args.get('interfaces', '').split(',') if name]
+        return jsonify(get_all_stats(interfaces or None))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
@@ -30,9 +45,25 @@ def get_stats_route(interface):
 
 @monitor_bp.route('/history/<interface>')
 def get_history_route(interface):
-    """获取网卡历史数据"""
+    """获取网卡历史数据 - 支持 ?range=10m|24h|90d&resolution=1s|1m|1h|auto"""
     try:
-        history = get_history(interface)
-        return jsonify(history)
+        range_value, resolution = request.args.get('range'), request.args.get('resolution')
+        version = get_history_version(interface, range_value, resolution)
+        response = not_modified(version)
+        if response is not None:
+            return response
+        history = get_history(interface, range_value, resolution)
+        if 'error' in history:
+            return jsonify(history), 400
+        return cached_json(history, version)
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+@monitor_bp.route('/usage')
+def get_usage_route():
+    """计费统计 - 日/月总量与5分钟速率p95/p99，?interfaces=eth0,eth1 指定子集"""
+    try:
+        interfaces = [name for name in request.args.get('interfaces', '').split(',') if name]
+        return jsonify(get_usage(interfaces or None))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
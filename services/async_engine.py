@@ -0,0 +1,348 @@
+"""DownOnly asyncio下载引擎 - 单事件循环承载大量并发流"""
+
+import asyncio
+import random
+import ssl
+import time
+import logging
+from urllib.parse import urlsplit, urljoin
+
+from services.log_pipeline import rate_limited, sampled
+from services.downonly_service import QuotaBudget
+
+
+class HttpError(Exception):
+    """HTTP请求失败"""
+
+
+class AsyncConnection:
+    """一条HTTP/1.1连接（asyncio streams），同源请求间保持复用"""
+
+    def __init__(self, origin, reader, writer):
+        self.origin = origin
+        self.reader = reader
+        self.writer = writer
+        self.reusable = True
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+class AsyncDownloadEngine:
+    """asyncio下载引擎 - 与线程引擎共享DownOnlyService的统计、配额和任务队列"""
+
+    MAX_REDIRECTS = 5
+
+    def __init__(self, service, generation):
+        self.logger = logging.getLogger(__name__)
+        self.service = service
+        self.generation = generation  # 服务重新启动后本引擎的协程自行退出
+        self.ssl_context = ssl.create_default_context()
+        self.tasks = {}
+
+    def run(self):
+        """在当前线程运行事件循环，直到服务停止"""
+        self.logger.info("DownOnly asyncio下载引擎启动")
+        try:
+            asyncio.run(self.supervisor())
+        except Exception as e:
+            self.logger.info(f"asyncio下载引擎错误: {e}")
+        self.logger.info("DownOnly asyncio下载引擎已退出")
+
+    async def supervisor(self):
+        """维持配置数量的下载协程"""
+        while self.service.is_active(self.generation):
+            for stream_id in range(self.service.concurrency):
+                task = self.tasks.get(stream_id)
+                if task is None or task.done():
+                    self.tasks[stream_id] = asyncio.create_task(self.stream_worker(stream_id))
+            await asyncio.sleep(1)
+
+        for task in self.tasks.values():
+            task.cancel()
+        await asyncio.gather(*self.tasks.values(), return_exceptions=True)
+        self.tasks = {}
+
+    async def stream_worker(self, stream_id):
+        """下载流协程"""
+        connection = None
+        try:
+            while self.service.is_active(self.generation) and stream_id < self.service.concurrency:
+                # 休息、非运行时段或配额已满时等待调度器开闸
+                if not self.service.scheduler.download_gate.is_set():
+                    await asyncio.sleep(0.5)
+                    continue
+                try:
+                    connection = await self.download_once(stream_id, connection)
+                    # 文件之间短暂间隔，长时间休息由调度器负责
+                    await asyncio.sleep(random.uniform(1, 3))
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.logger.info(f"下载线程错误[流{stream_id}]: {e}", extra=rate_limited(10))
+                    if connection:
+                        connection.close()
+                        connection = None
+                    # 失败已计入下载源评分，稍后立即换源
+                    await asyncio.sleep(random.uniform(1, 3))
+        finally:
+            if connection:
+                connection.close()
+
+    async def probe_url(self, url):
+        """获取文件元数据，优先使用缓存，未命中时发送HEAD；连接失败时返回None"""
+        url_cache = self.service.url_cache
+        metadata = url_cache.get_fresh(url)
+        if metadata:
+            return metadata
+
+        connection = None
+        try:
+            request_start = time.monotonic()
+            connection, status, headers, final_url = await self.request(
+                "HEAD", url, url_cache.conditional_headers(url), None)
+            self.service.source_pool.record_ttfb(url, time.monotonic() - request_start)
+            if status >= 400:
+                return {"size": 0, "accept_ranges": False, "final_url": url}
+            return url_cache.store(url, status, headers, final_url)
+        except Exception as e:
+            self.logger.info(f"获取文件大小失败: {e}")
+            self.service.source_pool.record_failure(url, e)
+            return None
+        finally:
+            if connection:
+                connection.close()
+
+    async def next_task(self):
+        """获取下一个下载任务，与线程引擎使用同一个分段队列"""
+        service = self.service
+        for _ in range(max(1, len(service.urls))):
+            with service.segment_lock:
+                if service.segment_queue:
+                    return service.segment_queue.popleft()
+                if not service.urls:
+                    return None
+                url = service.pick_url()
+            if url is None:
+                return None
+
+            metadata = await self.probe_url(url)
+            if metadata is None:
+                # 探测失败已计入评分，换一个下载源
+                continue
+            return service.make_task(url, metadata)
+        return None
+
+    async def open_connection(self, origin):
+        scheme, host, port = origin
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self.ssl_context if scheme == 'https' else None,
+                                    limit=256 * 1024),
+            timeout=30)
+        return AsyncConnection(origin, reader, writer)
+
+    async def request(self, method, url, headers, connection):
+        """发送请求并读取响应头，自动跟随重定向；返回(连接, 状态码, 响应头, 最终URL)"""
+        for _ in range(self.MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            scheme = parts.scheme or 'http'
+            port = parts.port or (443 if scheme == 'https' else 80)
+            origin = (scheme, parts.hostname, port)
+            if connection is None or connection.origin != origin or not connection.reusable:
+                if connection:
+                    connection.close()
+                connection = await self.open_connection(origin)
+
+            path = parts.path or '/'
+            if parts.query:
+                path += '?' + parts.query
+            lines = [f"{method} {path} HTTP/1.1", f"Host: {parts.netloc}",
+                     "User-Agent: Mozilla/5.0", "Accept: */*",
+                     "Accept-Encoding: identity", "Connection: keep-alive"]
+            lines.extend(f"{key}: {value}" for key, value in headers.items())
+            connection.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+            await connection.writer.drain()
+
+            status, response_headers = await self.read_headers(connection)
+            if status in (301, 302, 303, 307, 308) and 'location' in response_headers:
+                await self.drain_body(connection, method, status, response_headers)
+                url = urljoin(url, response_headers['location'])
+                continue
+            return connection, status, response_headers, url
+        raise HttpError(f"重定向次数过多: {url}")
+
+    async def read_headers(self, connection):
+        reader = connection.reader
+        status_line = await asyncio.wait_for(reader.readline(), timeout=30)
+        if not status_line:
+            raise HttpError("连接已被服务器关闭")
+        parts = status_line.decode('latin-1').split(None, 2)
+        if len(parts) < 2:
+            raise HttpError(f"无效的响应行: {status_line!r}")
+        status = int(parts[1])
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=30)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        connection.reusable = headers.get('connection', '').lower() != 'close'
+        return status, headers
+
+    async def read_chunk(self, reader, size, budget):
+        """读取至多size字节；budget按剩余配额截断读取长度并预留，返回(读取字节数, 预留字节数)"""
+        granted = budget(size) if budget else 0
+        if budget and not granted:
+            return None, 0
+        try:
+            data = await asyncio.wait_for(reader.read(granted or size), timeout=30)
+        except BaseException:
+            if granted:
+                self.service.release_quota(granted)
+            raise
+        if not data and granted:
+            self.service.release_quota(granted)
+            granted = 0
+        return len(data), granted
+
+    async def iter_body(self, connection, method, status, headers, chunk_size, budget=None):
+        """按块读取响应体并直接丢弃，产出(读取字节数, 预留配额)；配额用尽时提前结束"""
+        if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+            return
+        reader = connection.reader
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), timeout=30)
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # 跳过trailer
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    return
+                while size > 0:
+                    nbytes, granted = await self.read_chunk(reader, min(size, chunk_size), budget)
+                    if nbytes is None:
+                        connection.reusable = False
+                        return
+                    if not nbytes:
+                        raise HttpError("分块传输意外中断")
+                    size -= nbytes
+                    yield nbytes, granted
+                await reader.readline()
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining > 0:
+                nbytes, granted = await self.read_chunk(reader, min(remaining, chunk_size), budget)
+                if nbytes is None:
+                    connection.reusable = False
+                    return
+                if not nbytes:
+                    raise HttpError("响应体意外中断")
+                remaining -= nbytes
+                yield nbytes, granted
+        else:
+            connection.reusable = False
+            while True:
+                nbytes, granted = await self.read_chunk(reader, chunk_size, budget)
+                if not nbytes:
+                    return
+                yield nbytes, granted
+
+    async def drain_body(self, connection, method, status, headers):
+        async for _ in self.iter_body(connection, method, status, headers, 64 * 1024):
+            pass
+
+    async def download_once(self, stream_id, connection):
+        """执行一次下载任务，返回可复用的连接"""
+        service = self.service
+        task = await self.next_task()
+        if task is None:
+            if service.urls:
+                wait = service.source_pool.next_retry_in()
+                self.logger.info(f"所有下载源均处于熔断状态，{wait:.0f} 秒后重试", extra=rate_limited(60))
+                await asyncio.sleep(min(wait, 10))
+            else:
+                self.logger.info("没有可用的下载URL，等待配置...", extra=rate_limited(60))
+                await asyncio.sleep(10)
+            return connection
+
+        url = task["url"]
+        file_size = task["file_size"]
+        headers = {}
+        is_segment = task["start"] is not None
+        if is_segment:
+            headers['Range'] = f"bytes={task['start']}-{task['end']}"
+            file_size = task["end"] - task["start"] + 1
+
+        range_info = f" [{headers['Range']}]" if is_segment else ""
+        # 并发流很多时每秒有大量下载开始/完成，抽样记录
+        self.logger.info(f"[流{stream_id}] 开始下载(asyncio): {url}{range_info} (大小: {file_size / 1024 / 1024:.1f} MB)",
+                         extra=sampled(10))
+
+        start_time = time.time()
+        downloaded_bytes = 0
+        completed = False
+        interrupted = False
+        try:
+            connection, status, response_headers, _ = await self.request("GET", task["target"], headers, connection)
+            service.source_pool.record_ttfb(url, time.time() - start_time)
+            if status >= 400:
+                connection.reusable = False
+                if task["target"] != url:
+                    # 缓存的重定向目标已失效，下次重新解析
+                    service.url_cache.invalidate(url)
+                raise HttpError(f"HTTP {status}: {url}")
+
+            chunk_size = service.rate_limiter.chunk_size(service.read_buffer_size)
+            budget = QuotaBudget(service.reserve_quota)
+            async for nbytes, reserved in self.iter_body(connection, "GET", status, response_headers, chunk_size,
+                                                         budget=budget):
+                wait = service.rate_limiter.reserve(nbytes)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                downloaded_bytes += nbytes
+                service.add_downloaded_bytes(stream_id, nbytes, reserved)
+
+                # 服务停止或调度器关闸（休息、时段结束、配额用尽）时中断本次下载
+                if not service.is_active(self.generation) or not service.scheduler.download_gate.is_set():
+                    interrupted = True
+                    break
+
+                # 服务器忽略Range返回整个文件时，读满分段长度即停止
+                if is_segment and status != 206 and downloaded_bytes >= file_size:
+                    break
+            else:
+                # 配额用尽时iter_body提前结束，连接已标记为不可复用；截断的下载不计入成功和吞吐量
+                completed = True
+                interrupted = budget.exhausted or not service.scheduler.download_gate.is_set()
+        except Exception as e:
+            service.source_pool.record_failure(url, e, downloaded_bytes)
+            if service.is_active(self.generation):
+                service.requeue_segment(task, downloaded_bytes)
+            raise
+        finally:
+            if not completed and connection:
+                # 响应体未读完的连接不能复用
+                connection.close()
+                connection = None
+
+        download_duration = time.time() - start_time
+        if interrupted:
+            if service.is_active(self.generation):
+                service.requeue_segment(task, downloaded_bytes, failed=False)
+        else:
+            service.source_pool.record_success(url, downloaded_bytes, download_duration)
+            service.meter.count_download()
+        if download_duration > 0:
+            avg_speed_mbps = (downloaded_bytes / download_duration / 1024 / 1024) * 8
+            self.logger.info(f"[流{stream_id}] 下载完成: {downloaded_bytes / 1024 / 1024:.1f} MB, 平均速度: {avg_speed_mbps:.2f} Mbps",
+                             extra=sampled(10))
+
+        if connection and not connection.reusable:
+            connection.close()
+            connection = None
+        return connection
@@ -2,16 +2,94 @@
 
 import os
 import json
+import time
+import atexit
+import threading
 import logging
+from types import MappingProxyType
 from datetime import datetime
 
+
+def freeze(value):
+    """转换为只读结构：dict -> MappingProxyType，list -> tuple"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+# 配置字段所属的子系统，配置变化时只有受影响的子系统重新配置
+CONFIG_GROUPS = {
+    "rate_limit": ("speed_limit_mbps",),
+    "schedule": ("schedule_start", "schedule_end", "sleep_min_minutes", "sleep_max_minutes",
+                 "burst_min_minutes", "burst_max_minutes", "daily_quota_min_gb", "daily_quota_max_gb", "pacing"),
+    "sources": ("urls", "multi_source", "url_cache_ttl_minutes"),
+    "engine": ("engine", "concurrency", "range_split", "segment_size_mb", "discard_mode"),
+}
+
+
+class ConfigChange:
+    """一次配置变化 - 变化的字段、新旧快照和受影响的子系统（CONFIG_GROUPS的键）"""
+
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.keys = frozenset(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+        self.groups = frozenset(group for group, keys in CONFIG_GROUPS.items() if self.keys.intersection(keys))
+
+    def affects(self, group):
+        return group in self.groups
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def __repr__(self):
+        return f"ConfigChange(keys={sorted(self.keys)}, groups={sorted(self.groups)})"
+
+
+def thaw(value):
+    """只读结构转换回可修改的 dict / list"""
+    if isinstance(value, MappingProxyType):
+        return {key: thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw(item) for item in value]
+    return value
+
 class ConfigService:
-    """配置服务 - 修复版"""
+    """配置服务 - 修复版
     
-    def __init__(self):
+    配置以只读快照的形式缓存在内存中，只有配置文件的修改时间/大小/inode变化时才重新解析；
+    变化时通知订阅者（如流量黑洞服务），订阅者不需要自己轮询配置。
+    保存时内存快照立即生效，写文件在短时间内合并（连续多次保存只写一次），
+    并以 临时文件 + fsync + rename 的方式原子替换，崩溃时不会留下写了一半的配置文件。
+    """
+    
+    def __init__(self, watch_interval=2, save_delay=0.5, save_max_delay=3):
         self.logger = logging.getLogger(__name__)
+        self.lock = threading.RLock()
+        self.snapshot = MappingProxyType({})
+        self.version = 0  # 每次替换快照加一，用于HTTP ETag
+        self.signature = None  # 上次加载时配置文件的 (mtime_ns, size, inode)
+        self.subscribers = []
+        self.watch_interval = watch_interval  # 检查配置文件被外部修改的间隔（有订阅者时）
+        self.watching = False
+        self.save_delay = save_delay  # 最后一次保存后等待多久写文件
+        self.save_max_delay = save_max_delay  # 连续保存时最多推迟多久
+        self.pending = None  # 尚未写入文件的配置
+        self.pending_since = None
+        self.save_timer = None
+        self.write_error = None  # 上次写配置文件失败的原因，写入成功后清除
+        atexit.register(self.flush)
         # 使用正确的配置文件路径
         self.config_file = "/vol1/1000/Smart-Network-Tool/data/config.json"
+        self.data_dir = os.path.dirname(self.config_file)  # 其他持久化数据与配置文件放在同一目录
         
         # 默认配置 - 与前端保持一致
         self.default_config = {
@@ -22,6 +100,16 @@ class ConfigService:
             "schedule_end": "23:59",
             "sleep_min_minutes": 10,
             "sleep_max_minutes": 20,
+            "engine": "threads",  # 下载引擎: threads / asyncio（大量并发流时使用）
+            "concurrency": 4,  # 并发下载流数
+            "multi_source": True,  # 按评分加权分布到多个下载源，关闭则只用评分最高的源
+            "range_split": True,  # 支持Range的文件分段并行下载
+            "segment_size_mb": 64,  # Range分段大小
+            "discard_mode": "readinto",  # 数据丢弃方式: readinto(零拷贝) / iter_content
+            "url_cache_ttl_minutes": 60,  # 下载源元数据缓存有效期
+            "burst_min_minutes": 20,  # 每轮连续下载的最短时长，之后进入随机休息
+            "burst_max_minutes": 40,  # 每轮连续下载的最长时长
+            "pacing": False,  # 匀速下载：按剩余配额和剩余运行时段计算速率，均匀分布全天流量
             "urls": []  # 移除所有默认下载源，只保留用户自定义的
         }
         
@@ -29,7 +117,7 @@ class ConfigService:
         os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
         
         # 加载配置
-        self.config = self.load_config()
+        self.refresh()
         self.logger.info(f"配置服务初始化完成")
         self.logger.info(f"配置文件: {self.config_file}")
     
@@ -59,46 +147,182 @@ class ConfigService:
                         if key not in config:
                             config[key] = value
                     
-                    self.logger.info(f"最终配置结构: {config}")
                     return config
             else:
                 self.logger.info("配置文件不存在，创建默认配置")
                 # 保存默认配置
-                self.save_config(self.default_config.copy())
+                self.write_file(self.default_config)
                 return self.default_config.copy()
         except Exception as e:
             self.logger.info(f"加载配置失败: {e}")
-            # 使用默认配置
-            self.save_config(self.default_config.copy())
+            if self.snapshot:
+                # 已有配置时（如文件被外部编辑器写了一半）保留当前配置，不覆盖文件
+                return thaw(self.snapshot)
+            # 保留无法解析的文件以便手工恢复（如URL列表），再使用默认配置
+            try:
+                corrupt_file = f"{self.config_file}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+                os.replace(self.config_file, corrupt_file)
+                self.logger.info(f"无法解析的配置文件已保留为: {corrupt_file}")
+            except OSError:
+                pass
+            self.write_file(self.default_config)
             return self.default_config.copy()
     
-    def save_config(self, config):
-        """保存配置 - 修复版"""
+    def file_signature(self):
+        """配置文件的 (mtime_ns, size, inode)，文件不存在时为None"""
         try:
-            self.logger.info(f"正在保存配置到默认配置文件: {config}")
-            
-            # 确保目录存在
-            os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
-            
-            # 保存配置到默认配置文件
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config, f, indent=4, ensure_ascii=False)
-            
-            # 更新内存中的配置
-            self.config = config.copy()
-            
-            self.logger.info(f"配置已保存到默认配置文件: {self.config_file}")
+            stat = os.stat(self.config_file)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+    
+    def refresh(self):
+        """配置文件有变化时重新加载快照并通知订阅者；返回是否重新加载"""
+        signature = self.file_signature()
+        if self.pending is not None or (signature is not None and signature == self.signature):
+            # 有尚未写入的保存时以内存为准
+            return False
+        with self.lock:
+            signature = self.file_signature()
+            if self.pending is not None or (signature is not None and signature == self.signature):
+                return False
+            config = self.load_config()
+            # load_config可能创建了默认配置文件，取加载后的签名
+            self.signature = self.file_signature()
+            self.replace_snapshot(config)
             return True
-            
-        except Exception as e:
-            self.logger.info(f"保存配置失败: {e}")
+    
+    def replace_snapshot(self, config):
+        """替换内存快照，有字段变化时通知订阅者（需持有锁）"""
+        old = self.snapshot
+        self.snapshot = freeze(config)
+        # 先替换快照再增加版本号：读取方先取版本号再取快照，不会出现新版本号配旧内容
+        self.version += 1
+        change = ConfigChange(old, self.snapshot)
+        if not old or not change:
+            return
+        self.logger.info(f"配置已更新，变化字段: {sorted(change.keys)}，影响: {sorted(change.groups)}")
+        for callback in list(self.subscribers):
+            try:
+                callback(self.snapshot, change)
+            except Exception as e:
+                self.logger.info(f"配置变化通知失败: {e}")
+    
+    def write_file(self, config):
+        """原子写入配置文件：写临时文件并fsync后rename替换，再fsync目录使rename持久化"""
+        with self.lock:
+            try:
+                directory = os.path.dirname(self.config_file)
+                os.makedirs(directory, exist_ok=True)
+                temp_file = self.config_file + '.tmp'
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(config, f, indent=4, ensure_ascii=False)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_file, self.config_file)
+                try:
+                    dir_fd = os.open(directory, os.O_RDONLY)
+                    try:
+                        os.fsync(dir_fd)
+                    finally:
+                        os.close(dir_fd)
+                except OSError:
+                    pass  # 部分平台/文件系统不支持对目录fsync
+                
+                # 自己写入的文件不再重新解析
+                self.signature = self.file_signature()
+                self.write_error = None
+                self.logger.info(f"配置已保存到默认配置文件: {self.config_file}")
+                return True
+                
+            except Exception as e:
+                self.write_error = str(e)
+                self.logger.info(f"保存配置失败: {e}")
+                return False
+    
+    def check_writable(self):
+        """配置目录是否可写；不可写时记录原因"""
+        directory = os.path.dirname(self.config_file)
+        if os.path.isdir(directory) and not os.access(directory, os.W_OK):
+            self.write_error = f"配置目录不可写: {directory}"
+            return False
+        return True
+    
+    def save_config(self, config):
+        """保存配置 - 内存快照和订阅者立即更新，文件写入合并后延迟执行
+        
+        配置目录不可写时不保存并返回False；上次写文件失败（如磁盘已满）时改为立即写入，
+        返回本次写入的结果，失败原因见 write_error。
+        """
+        with self.lock:
+            if not self.check_writable():
+                self.logger.info(f"保存配置失败: {self.write_error}")
+                return False
+            self.replace_snapshot(config)
+            if self.write_error is not None:
+                self.pending = thaw(self.snapshot)
+                return self.flush()
+            self.pending = thaw(self.snapshot)
+            now = time.monotonic()
+            if self.pending_since is None:
+                self.pending_since = now
+            # 最后一次保存后 save_delay 秒写入，但距第一次未写入的保存不超过 save_max_delay 秒
+            delay = max(0.0, min(self.save_delay, self.pending_since + self.save_max_delay - now))
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(delay, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+            return True
+    
+    def flush(self):
+        """立即写入尚未保存的配置（定时器触发，或退出时）"""
+        with self.lock:
+            if self.save_timer is not None:
+                self.save_timer.cancel()
+                self.save_timer = None
+            config = self.pending
+            if config is None:
+                return True
+            self.pending = None
+            self.pending_since = None
+            if self.write_file(config):
+                return True
+            # 写入失败时保留，下次保存或退出时重试
+            self.pending = config
             return False
     
+    def get_snapshot(self):
+        """当前配置的只读快照（不复制），文件未变化时只需一次stat"""
+        self.refresh()
+        return self.snapshot
+    
+    def get_version(self):
+        """当前快照的版本号，配置文件未变化时只需一次stat"""
+        self.refresh()
+        return self.version
+    
     def get_config(self):
-        """获取配置"""
-        # 重新加载配置确保是最新的
-        fresh_config = self.load_config()
-        return fresh_config.copy()
+        """获取配置 - 可修改的副本"""
+        return thaw(self.get_snapshot())
+    
+    def subscribe(self, callback):
+        """注册配置变化回调 callback(只读快照, ConfigChange)，并开始监视配置文件的外部修改"""
+        with self.lock:
+            self.subscribers.append(callback)
+            if self.watching:
+                return
+            self.watching = True
+        threading.Thread(target=self.watch, daemon=True).start()
+    
+    def watch(self):
+        """定期检查配置文件是否被外部修改（每次只是一次stat）"""
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                self.logger.info(f"检查配置文件失败: {e}")
     
     def update_config(self, updates):
         """更新配置"""
@@ -112,18 +336,10 @@ class ConfigService:
             else:
                 # 如果发送空URL列表，保持现有URL不变
                 pass
-        else:
-            config.update(updates)
-        
-        # 如果有配额更新，通知流量黑洞服务
-        if 'daily_quota_min_gb' in updates:
-            try:
-                from services.downonly_service import update_daily_quota
-                update_daily_quota(updates.get('daily_quota_min_gb', 150))
-            except Exception as e:
-                self.logger.info(f"更新流量黑洞配额失败: {e}")
+        # 其他字段直接合并（表单保存时会同时提交URL列表）
+        config.update({key: value for key, value in updates.items() if key != 'urls'})
         
-        self.logger.info(f"更新配置后最终配置: {config}")
+        # 保存后由订阅者（流量黑洞服务）按变化的字段应用新配置
         return self.save_config(config)
     
     def reset_to_default(self):
@@ -136,11 +352,29 @@ config_service = ConfigService()
 def get_config():
     return config_service.get_config()
 
+def get_snapshot():
+    return config_service.get_snapshot()
+
+def get_version():
+    return config_service.get_version()
+
+def subscribe(callback):
+    return config_service.subscribe(callback)
+
 def save_config(config):
     return config_service.save_config(config)
 
+def flush():
+    return config_service.flush()
+
+def get_write_error():
+    return config_service.write_error
+
 def update_config(updates):
     return config_service.update_config(updates)
 
 def reset_to_default():
-    return config_service.reset_to_default()
\ No newline at end of file
+    return config_service.reset_to_default()
+
+def get_data_dir():
+    return config_service.data_dir
\ No newline at end of file
@@ -4,50 +4,148 @@ import threading
 import time
 import random
 import requests
-import io
+from collections import deque
 from datetime import datetime, timedelta
 import logging
 
+from services.rate_limiter import rate_limiter
+from services.source_pool import SourcePool
+from services.url_cache import url_cache
+from services.traffic_ledger import traffic_ledger
+from services.scheduler import DownloadScheduler
+from services.metering import ThroughputMeter
+from services.log_pipeline import rate_limited, sampled
+
+class QuotaBudget:
+    """一次下载的配额预留入口，记录读取是否因配额用尽而被截断"""
+    
+    def __init__(self, reserve):
+        self.reserve = reserve
+        self.exhausted = False
+    
+    def __call__(self, nbytes):
+        granted = self.reserve(nbytes)
+        if not granted:
+            self.exhausted = True
+        return granted
+
+
 class DownOnlyService:
     """DownOnly服务 - 真实网络下载版"""
     
+    SEGMENT_MAX_ATTEMPTS = 3  # Range分段失败后最多重新排队的次数
+    
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.is_running = False
-        self.current_speed = 0.0
-        self.speed_history = []
-        self.download_count = 0
-        self.total_downloaded = 0
-        self.today_total_bytes = 0  # 今日累计字节数
+        self.generation = 0  # 每次启动加一，上一次运行遗留的线程发现不一致后退出
+        self.meter = ThroughputMeter(history_size=30)  # 分片字节计数 + EWMA速率，速度历史为定长环形缓冲区
+        self.today_total_bytes = 0  # 今日累计字节数（由流量账本恢复和维护）
+        self.ledger = traffic_ledger  # 持久化的按小时流量账本
         self.daily_quota_bytes = 150 * 1024 * 1024 * 1024  # 默认150GB配额
         self.start_time = None
         self.total_uptime_seconds = 0  # 累计运行时间
-        self.speed_history_max = 30
         self.urls = []  # 移除所有默认下载源，只使用用户自定义的
-        self.session = requests.Session()  # 复用会话以提高性能
+        
+        # 并行下载引擎参数（从配置加载）
+        self.engine = "threads"  # threads: 每流一个线程; asyncio: 单事件循环承载所有流
+        self.concurrency = 4  # 并发下载流数
+        self.multi_source = True  # True: 按评分加权分布到多个下载源; False: 始终使用评分最高的源
+        self.range_split = True  # 对支持Range的文件按分段并行下载
+        self.segment_size_bytes = 64 * 1024 * 1024  # Range分段大小
+        self.rate_limiter = rate_limiter  # 所有下载流共享的令牌桶
+        self.speed_limit_mbps = 0.0  # 用户配置的限速上限，0 表示不限速
+        self.paced_rate_mbps = None  # 匀速下载模式下调度器计算的目标速率，None 表示未启用
+        self.discard_mode = "readinto"  # readinto: 复用缓冲区零拷贝丢弃; iter_content: 旧的逐块分配方式
+        self.read_buffer_size = 1024 * 1024
+        self.stream_buffers = {}  # 每个流预分配一个读缓冲区
+        self.worker_thread = None
+        
+        # 多流共享状态
+        self.stats_lock = threading.Lock()  # 保护流量统计
+        self.segment_lock = threading.Lock()  # 保护分段队列
+        self.segment_queue = deque()  # 待下载的Range分段
+        self.source_pool = SourcePool()  # 下载源健康统计与选择
+        self.url_cache = url_cache  # 下载源元数据缓存（大小、Range支持、重定向目标）
+        self.reserved_bytes = 0  # 已预留但尚未读取的配额字节
+        
+        self.scheduler = DownloadScheduler(self)  # 运行时段、休息和每日配额
+        self.session = self.create_session()  # 复用会话以提高性能
+        
+        # 配置变化时由配置服务通知，不需要轮询配置文件
+        import services.config_service as config_service
+        config_service.subscribe(self.on_config_changed)
+        
+    def create_session(self):
+        """创建下载会话，连接池大小随并发流数调整"""
+        session = requests.Session()
+        pool_size = max(10, self.concurrency)
         # 配置session以优化性能
-        self.session.mount('http://', requests.adapters.HTTPAdapter(
+        session.mount('http://', requests.adapters.HTTPAdapter(
             pool_connections=5,
-            pool_maxsize=10,
+            pool_maxsize=pool_size,
             max_retries=3
         ))
-        self.session.mount('https://', requests.adapters.HTTPAdapter(
+        session.mount('https://', requests.adapters.HTTPAdapter(
             pool_connections=5,
-            pool_maxsize=10,
+            pool_maxsize=pool_size,
             max_retries=3
         ))
+        return session
         
-    def load_urls_from_config(self):
-        """从配置服务加载URL列表"""
-        try:
+    def load_urls_from_config(self, config=None):
+        """从配置服务加载URL列表及全部下载参数（启动时）"""
+        if config is None:
             import services.config_service as config_service
-            config = config_service.get_config()
-            self.urls = config.get('urls', [])
+            config = config_service.get_snapshot()
+        self.load_sources_config(config)
+        self.load_engine_config(config)
+        self.update_speed_limit(config.get('speed_limit_mbps', 0))
+        self.scheduler.load_config(config)
+    
+    def load_sources_config(self, config):
+        """从配置加载下载源：URL列表、多源选择和元数据缓存有效期"""
+        try:
+            self.urls = list(config.get('urls', []))
+            self.multi_source = bool(config.get('multi_source', self.multi_source))
+            self.source_pool.sync(self.urls)
+            self.url_cache.set_ttl(int(config.get('url_cache_ttl_minutes', 60)) * 60)
+            self.url_cache.prune(self.urls)
             self.logger.info(f"从配置加载URL列表: {self.urls}")
         except Exception as e:
             self.logger.info(f"从配置加载URL失败: {e}")
             self.urls = []
     
+    def load_engine_config(self, config):
+        """从配置加载并行下载引擎参数"""
+        try:
+            self.concurrency = max(1, int(config.get('concurrency', self.concurrency)))
+            engine = config.get('engine', self.engine)
+            self.engine = engine if engine in ("threads", "asyncio") else "threads"
+            self.range_split = bool(config.get('range_split', self.range_split))
+            segment_size_mb = int(config.get('segment_size_mb', self.segment_size_bytes // (1024 * 1024)))
+            self.segment_size_bytes = max(1, segment_size_mb) * 1024 * 1024
+            discard_mode = config.get('discard_mode', self.discard_mode)
+            self.discard_mode = discard_mode if discard_mode in ("readinto", "iter_content") else "readinto"
+            self.logger.info(f"并行下载配置: 引擎={self.engine}, 并发流数={self.concurrency}, 多源={self.multi_source}, "
+                             f"Range分段={self.range_split}, 分段大小={segment_size_mb} MB")
+        except Exception as e:
+            self.logger.info(f"加载并行下载配置失败: {e}")
+    
+    def on_config_changed(self, config, change):
+        """配置变化回调：只重新配置受影响的子系统，正在进行的下载不中断"""
+        self.logger.info(f"配置变化 {sorted(change.keys)}，重新配置: {sorted(change.groups)}")
+        if change.affects("sources"):
+            self.load_sources_config(config)
+        if change.affects("engine"):
+            # concurrency 立即生效（工作线程/协程每秒按它增减下载流）；range_split、segment_size_mb、
+            # discard_mode 从下一个下载任务开始生效；engine 只在启动服务时读取，切换需重新启动服务
+            self.load_engine_config(config)
+        if change.affects("rate_limit"):
+            self.update_speed_limit(config.get('speed_limit_mbps', 0))
+        if change.affects("schedule"):
+            self.scheduler.load_config(config)
+    
     def update_urls_from_config(self):
         """从配置服务更新URL列表"""
         self.load_urls_from_config()
@@ -65,28 +163,41 @@ class DownOnlyService:
             self.start_service()
             return {"is_running": True, "status": "running"}
     
+    def is_active(self, generation):
+        """generation对应的那次运行是否仍在进行；服务已停止或已重新启动时返回False"""
+        return self.is_running and generation == self.generation
+    
     def start_service(self):
         """启动服务"""
         if self.is_running:
             return
         
+        # 等待上一次运行的下载流退出；未退出的流因generation不一致，读完当前数据块后自行退出
+        self.join_worker(timeout=5)
+        
         # 启动前初始化URL列表
         self.initialize_urls()
         
+        self.generation += 1
+        generation = self.generation
         self.is_running = True
         self.start_time = datetime.now()
-        self.download_count = 0
-        self.total_downloaded = 0
-        self.today_total_bytes = 0  # 重置今日流量统计
-        self.speed_history = []
+        self.meter.reset()
+        self.today_total_bytes = self.ledger.get_today_bytes()  # 从账本恢复今日流量，重启不丢失
+        self.reserved_bytes = 0
+        with self.segment_lock:
+            self.segment_queue.clear()
+        self.session = self.create_session()
         
         # 添加启动日志
         self.logger.info("DownOnly服务启动 - 真实网络下载模式")
         self.logger.info(f"当前URL列表: {self.urls}")
         
-        # 启动工作线程
-        threading.Thread(target=self.worker, daemon=True).start()
-        threading.Thread(target=self.speed_tracker, daemon=True).start()
+        # 启动调度器和工作线程
+        self.scheduler.start(generation)
+        self.worker_thread = threading.Thread(target=self.worker, args=(generation,), daemon=True)
+        self.worker_thread.start()
+        threading.Thread(target=self.speed_tracker, args=(generation,), daemon=True).start()
         
         # 立即添加一条启动日志
         self.logger.info("DownOnly服务已启动")
@@ -99,169 +210,365 @@ class DownOnlyService:
             self.total_uptime_seconds += uptime
             
         self.is_running = False
+        self.scheduler.stop()
         self.logger.info("DownOnly服务已停止")
     
-    def worker(self):
-        """工作线程 - 真实网络下载"""
-        while self.is_running:
+    def join_worker(self, timeout):
+        """等待工作线程（及其下载流）退出，最多timeout秒"""
+        if self.worker_thread is None:
+            return
+        self.worker_thread.join(timeout)
+        if self.worker_thread.is_alive():
+            self.logger.info(f"下载线程 {timeout} 秒内未退出，放弃等待")
+    
+    def shutdown(self, timeout=10):
+        """进程退出前调用：停止下载并等待下载流退出，账本落盘"""
+        if self.is_running:
+            self.stop_service()
+        self.join_worker(timeout)
+        self.ledger.flush()
+    
+    def worker(self, generation):
+        """工作线程 - 维持配置数量的并行下载流"""
+        if self.engine == "asyncio":
+            # 所有下载流运行在本线程的事件循环中
+            from services.async_engine import AsyncDownloadEngine
+            AsyncDownloadEngine(self, generation).run()
+            return
+        
+        streams = {}
+        while self.is_active(generation):
             try:
-                # 真实网络下载
-                self.real_download()
-                
-                # 随机休息
-                sleep_time = random.randint(5, 15)
-                time.sleep(sleep_time)
+                # 补齐缺失或已退出的下载流，并发数变化时自动增减
+                for stream_id in range(self.concurrency):
+                    thread = streams.get(stream_id)
+                    if thread is None or not thread.is_alive():
+                        thread = threading.Thread(target=self.stream_worker, args=(stream_id, generation), daemon=True)
+                        streams[stream_id] = thread
+                        thread.start()
                 
+                time.sleep(1)
             except Exception as e:
-                self.logger.info(f"下载线程错误: {e}")
+                self.logger.info(f"下载调度线程错误: {e}")
                 time.sleep(5)
+        
+        # 等待各下载流读完当前数据块后退出
+        for thread in streams.values():
+            thread.join(timeout=5)
     
-    def speed_tracker(self):
-        """速度追踪器"""
-        while self.is_running:
+    def stream_worker(self, stream_id, generation):
+        """下载流线程 - 真实网络下载"""
+        while self.is_active(generation) and stream_id < self.concurrency:
+            # 休息、非运行时段或配额已满时等待调度器开闸
+            if not self.scheduler.download_gate.wait(timeout=1):
+                continue
             try:
-                # 生成实际速度数据（基于真实下载）
-                if self.current_speed > 0:
-                    # 保持当前速度，添加一些波动
-                    variation = random.uniform(-2, 2)
-                    self.current_speed = max(0, self.current_speed + variation)
-                else:
-                    # 如果没有下载，速度降为0
-                    self.current_speed = 0
+                # 真实网络下载
+                self.real_download(stream_id, generation)
                 
-                # 更新速度历史
-                self.speed_history.append(self.current_speed)
-                if len(self.speed_history) > self.speed_history_max:
-                    self.speed_history.pop(0)
+                # 文件之间短暂间隔，长时间休息由调度器负责
+                time.sleep(random.uniform(1, 3))
                 
-                time.sleep(1)
             except Exception as e:
-                self.logger.info(f"速度追踪错误: {e}")
-                time.sleep(1)
+                self.logger.info(f"下载线程错误[流{stream_id}]: {e}")
+                time.sleep(5)
     
-    def real_download(self):
-        """真实网络下载 - 使用io.Discard技术，0磁盘写入"""
-        if not self.is_running:
+    def reserve_quota(self, nbytes):
+        """读取前预留配额，返回允许读取的字节数；多个流并发时也不会超出配额"""
+        with self.stats_lock:
+            available = self.daily_quota_bytes - self.today_total_bytes - self.reserved_bytes
+            granted = max(0, min(nbytes, available))
+            self.reserved_bytes += granted
+        if granted == 0:
+            self.scheduler.on_quota_reached()
+        return granted
+    
+    def release_quota(self, nbytes):
+        """归还未使用的预留配额（读取失败时）"""
+        with self.stats_lock:
+            self.reserved_bytes -= nbytes
+    
+    def add_downloaded_bytes(self, stream_id, new_bytes, reserved=0):
+        """所有下载流共享的流量统计，reserved为本次读取前预留的配额"""
+        # 吞吐量计入本流的计数分片，不占用共享锁
+        self.meter.add(stream_id, new_bytes)
+        with self.stats_lock:
+            self.reserved_bytes -= reserved
+            self.today_total_bytes = self.ledger.add(new_bytes)  # 跨天时账本自动归零
+            quota_reached = self.today_total_bytes >= self.daily_quota_bytes
+        if quota_reached:
+            self.scheduler.on_quota_reached()
+    
+    def refresh_today_bytes(self):
+        """从账本刷新今日流量（跨天后即使没有下载也会归零）"""
+        with self.stats_lock:
+            self.today_total_bytes = self.ledger.get_today_bytes()
+            return self.today_total_bytes
+    
+    def pick_url(self):
+        """按下载源评分选择下一个URL，所有源都熔断时返回None"""
+        return self.source_pool.select(weighted=self.multi_source)
+    
+    def probe_url(self, url):
+        """获取文件元数据（大小、Range支持、重定向目标），优先使用缓存，连接失败时返回None"""
+        metadata = self.url_cache.get_fresh(url)
+        if metadata:
+            return metadata
+        
+        try:
+            head_response = self.session.head(url, headers=self.url_cache.conditional_headers(url),
+                                              timeout=10, allow_redirects=True)
+            self.source_pool.record_ttfb(url, head_response.elapsed.total_seconds())
+            if head_response.status_code >= 400:
+                # 不支持HEAD的服务器，直接GET原地址
+                return {"size": 0, "accept_ranges": False, "final_url": url}
+            return self.url_cache.store(url, head_response.status_code, head_response.headers, head_response.url)
+        except Exception as e:
+            self.logger.info(f"获取文件大小失败: {e}")
+            self.source_pool.record_failure(url, e)
+            return None
+    
+    def next_task(self):
+        """获取下一个下载任务：优先领取未完成的Range分段，否则选择新的URL"""
+        for _ in range(max(1, len(self.urls))):
+            with self.segment_lock:
+                if self.segment_queue:
+                    return self.segment_queue.popleft()
+                if not self.urls:
+                    return None
+                url = self.pick_url()
+            if url is None:
+                return None
+            
+            metadata = self.probe_url(url)
+            if metadata is None:
+                # 探测失败已计入评分，换一个下载源
+                continue
+            return self.make_task(url, metadata)
+        return None
+    
+    def make_task(self, url, metadata):
+        """生成下载任务，文件足够大且服务器支持Range时拆分为多个分段供其他流领取"""
+        file_size = metadata["size"]
+        target = metadata.get("final_url") or url  # GET直接请求重定向后的地址
+        if (self.range_split and self.concurrency > 1 and metadata["accept_ranges"]
+                and file_size > self.segment_size_bytes):
+            segments = []
+            for start in range(0, file_size, self.segment_size_bytes):
+                end = min(start + self.segment_size_bytes, file_size) - 1
+                segments.append({"url": url, "target": target, "start": start, "end": end, "file_size": file_size})
+            with self.segment_lock:
+                self.segment_queue.extend(segments[1:])
+            self.logger.info(f"文件已拆分为 {len(segments)} 个分段: {url}")
+            return segments[0]
+        
+        return {"url": url, "target": target, "start": None, "end": None, "file_size": file_size}
+    
+    def get_stream_buffer(self, stream_id):
+        """获取该流的预分配读缓冲区（整个生命周期内复用）"""
+        buffer = self.stream_buffers.get(stream_id)
+        if buffer is None:
+            buffer = memoryview(bytearray(self.read_buffer_size))
+            self.stream_buffers[stream_id] = buffer
+        return buffer
+    
+    def iter_discard(self, response, stream_id, chunk_size, budget):
+        """读取响应体并直接丢弃，逐次产出(读取字节数, 预留配额)；budget为QuotaBudget，配额用尽时提前结束"""
+        if self.discard_mode == "iter_content":
+            # 块大小固定，配额只能在读取后检查，最多超出一个块
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                yield len(chunk), 0
+            return
+        
+        # 零拷贝模式：绕过urllib3的read()，由http.client直接recv_into到复用的缓冲区
+        raw = getattr(response.raw, '_fp', None)
+        if raw is None or not hasattr(raw, 'readinto'):
+            raw = response.raw
+        buffer = self.get_stream_buffer(stream_id)
+        while True:
+            # 按剩余配额截断读取长度，精确停在配额边界
+            granted = budget(chunk_size)
+            if not granted:
+                break
+            try:
+                nbytes = raw.readinto(buffer[:granted])
+            except Exception:
+                self.release_quota(granted)
+                raise
+            if not nbytes:
+                self.release_quota(granted)
+                break
+            yield nbytes, granted
+    
+    def speed_tracker(self, generation):
+        """速度追踪器 - 每秒汇总各流的计数分片，计算真实速率"""
+        while self.is_active(generation):
+            try:
+                self.meter.tick()
+            except Exception as e:
+                self.logger.info(f"速度追踪错误: {e}", extra=rate_limited(60))
+            time.sleep(1)
+        self.meter.tick()
+    
+    def requeue_segment(self, task, downloaded_bytes, failed=True):
+        """Range分段未读完（请求失败或被中断）时，把剩余部分放回队列由其他流继续下载
+
+        failed: 是否因下载失败放回，只有失败计入重试次数
+        """
+        if task is None or task["start"] is None:
+            return
+        start = task["start"] + downloaded_bytes
+        if start > task["end"]:
+            return
+        attempts = task.get("attempts", 0) + (1 if failed else 0)
+        if attempts > self.SEGMENT_MAX_ATTEMPTS:
+            self.logger.info(f"分段 bytes={start}-{task['end']} 已失败 {self.SEGMENT_MAX_ATTEMPTS} 次，放弃: {task['url']}")
+            return
+        with self.segment_lock:
+            self.segment_queue.appendleft(dict(task, start=start, attempts=attempts))
+    
+    def real_download(self, stream_id, generation):
+        """真实网络下载 - 数据读入复用缓冲区后直接丢弃，0磁盘写入"""
+        if not self.is_active(generation):
             return
         
+        task = None
+        downloaded_bytes = 0
         try:
-            # 随机选择URL
-            if not self.urls:
-                self.logger.info("没有可用的下载URL，等待配置...")
-                time.sleep(10)
+            # 领取下载任务（整个文件或Range分段）
+            task = self.next_task()
+            if task is None:
+                if self.urls:
+                    wait = self.source_pool.next_retry_in()
+                    self.logger.info(f"所有下载源均处于熔断状态，{wait:.0f} 秒后重试", extra=rate_limited(60))
+                    time.sleep(min(wait, 10))
+                else:
+                    self.logger.info("没有可用的下载URL，等待配置...", extra=rate_limited(60))
+                    time.sleep(10)
                 return
                 
-            url = random.choice(self.urls)
+            url = task["url"]
+            file_size = task["file_size"]
+            headers = {}
+            if self.discard_mode == "readinto":
+                # 原始字节直接丢弃，不需要服务器压缩
+                headers['Accept-Encoding'] = 'identity'
+            if task["start"] is not None:
+                headers['Range'] = f"bytes={task['start']}-{task['end']}"
+                file_size = task["end"] - task["start"] + 1
             
-            # 获取文件大小
-            try:
-                head_response = self.session.head(url, timeout=10, allow_redirects=True)
-                file_size = int(head_response.headers.get('content-length', 0))
-                
-                # 如果无法获取文件大小，使用默认值
-                if file_size == 0:
-                    # 根据URL类型估计文件大小
-                    if 'ubuntu' in url:
-                        file_size = random.randint(500, 2000) * 1024 * 1024  # Ubuntu ISO ~500MB-2GB
-                    elif 'centos' in url:
-                        file_size = random.randint(4000, 8000) * 1024 * 1024  # CentOS ISO ~4GB-8GB
-                    else:
-                        file_size = random.randint(100, 1000) * 1024 * 1024  # 其他文件 ~100MB-1GB
-                
-            except Exception as e:
-                self.logger.info(f"获取文件大小失败: {e}")
-                # 使用默认文件大小
-                file_size = random.randint(100, 1000) * 1024 * 1024
+            # 如果无法获取文件大小，使用默认值
+            if file_size == 0:
+                # 根据URL类型估计文件大小
+                if 'ubuntu' in url:
+                    file_size = random.randint(500, 2000) * 1024 * 1024  # Ubuntu ISO ~500MB-2GB
+                elif 'centos' in url:
+                    file_size = random.randint(4000, 8000) * 1024 * 1024  # CentOS ISO ~4GB-8GB
+                else:
+                    file_size = random.randint(100, 1000) * 1024 * 1024  # 其他文件 ~100MB-1GB
             
-            # 使用io.Discard来丢弃下载数据
-            discard_buffer = io.BytesIO()
             start_time = time.time()
             downloaded_bytes = 0
+            interrupted = False
             last_log_time = 0
-            last_speed_update = 0
             
-            self.logger.info(f"开始下载: {url} (大小: {file_size / 1024 / 1024:.1f} MB)")
+            is_segment = 'Range' in headers
+            range_info = f" [{headers['Range']}]" if is_segment else ""
+            # 与asyncio引擎一致，开始/完成下载抽样记录
+            self.logger.info(f"[流{stream_id}] 开始下载: {url}{range_info} (大小: {file_size / 1024 / 1024:.1f} MB)",
+                             extra=sampled(10))
             
             try:
                 # 使用流式下载
-                with self.session.get(url, timeout=30, stream=True) as response:
+                with self.session.get(task["target"], headers=headers, timeout=30, stream=True) as response:
+                    if response.status_code >= 400 and task["target"] != url:
+                        # 缓存的重定向目标已失效，下次重新解析
+                        self.url_cache.invalidate(url)
                     response.raise_for_status()
+                    self.source_pool.record_ttfb(url, response.elapsed.total_seconds())
                     
                     # 获取实际文件大小
                     actual_file_size = int(response.headers.get('content-length', file_size))
+                    # 服务器忽略Range返回整个文件时，只读取分段长度
+                    if is_segment and response.status_code != 206:
+                        actual_file_size = file_size
                     
-                    # 分块读取数据并丢弃
-                    chunk_size = 1024 * 1024  # 1MB块大小
-                    for chunk in response.iter_content(chunk_size=chunk_size):
-                        if not self.is_running:
-                            break
-                            
-                        # 将数据写入丢弃缓冲区（实际是丢弃）
-                        discard_buffer.write(chunk)
-                        downloaded_bytes += len(chunk)
+                    # 分块读取数据并丢弃，限速时缩小块大小使读取节奏更平滑
+                    chunk_size = self.rate_limiter.chunk_size(self.read_buffer_size)
+                    budget = QuotaBudget(self.reserve_quota)
+                    for nbytes, reserved in self.iter_discard(response, stream_id, chunk_size, budget):
+                        # 令牌桶限速：所有流共享，欠额时阻塞本流的下一次读取
+                        self.rate_limiter.consume(nbytes)
+                        downloaded_bytes += nbytes
+                        
+                        self.add_downloaded_bytes(stream_id, nbytes, reserved)
                         
-                        # 统计数据
-                        self.total_downloaded += len(chunk)
-                        new_bytes = len(chunk)
-                        self.today_total_bytes += new_bytes
-                        self.download_count += 1
+                        # 服务停止或调度器关闸（休息、时段结束、配额用尽）时中断本次下载
+                        if not self.is_active(generation) or not self.scheduler.download_gate.is_set():
+                            interrupted = True
+                            break
                         
-                        # 计算实时速度
+                        # 每个流每2秒检查一次进度，所有流合计每10秒最多记录一条
                         current_time = time.time()
                         elapsed_time = current_time - start_time
-                        
-                        # 每秒更新一次速度
-                        if current_time - last_speed_update >= 1.0:
-                            speed_mbps = (downloaded_bytes / elapsed_time / 1024 / 1024) * 8 if elapsed_time > 0 else 0
-                            self.current_speed = min(speed_mbps, 100)  # 限制最大速度
-                            last_speed_update = current_time
-                        
-                        # 每2秒记录一次进度
                         if current_time - last_log_time >= 2:
                             progress = (downloaded_bytes / actual_file_size) * 100 if actual_file_size > 0 else 0
                             speed_display = (downloaded_bytes / elapsed_time / 1024) if elapsed_time > 0 else 0
-                            self.logger.info(f"下载进度: {downloaded_bytes / 1024 / 1024:.1f}/{actual_file_size / 1024 / 1024:.1f} MB ({progress:.1f}%) {speed_display:.1f} KB/s")
+                            self.logger.info(f"[流{stream_id}] 下载进度: {downloaded_bytes / 1024 / 1024:.1f}/{actual_file_size / 1024 / 1024:.1f} MB ({progress:.1f}%) {speed_display:.1f} KB/s",
+                                             extra=rate_limited(10))
                             last_log_time = current_time
                         
-                        # 清理缓冲区以避免内存泄漏
-                        if downloaded_bytes % (10 * 1024 * 1024) == 0:  # 每10MB清理一次
-                            discard_buffer.seek(0)
-                            discard_buffer.truncate(0)
+                        # Range分段读取完毕
+                        if is_segment and downloaded_bytes >= file_size:
+                            break
+                    
+                    # 在配额边界截断的下载不是完整的文件，不计入下载源的成功和吞吐量
+                    if budget.exhausted:
+                        interrupted = True
                         
             except requests.exceptions.RequestException as e:
-                self.logger.info(f"下载请求失败: {e}")
-                # 等待一段时间后重试
-                time.sleep(random.uniform(5, 15))
+                # 网络中断时所有流同时失败，限流避免刷屏
+                self.logger.info(f"[流{stream_id}] 下载请求失败: {e}", extra=rate_limited(10))
+                # 记录失败后立即换源，退避由下载源熔断负责；未读完的分段放回队列
+                self.source_pool.record_failure(url, e, downloaded_bytes)
+                if self.is_active(generation):
+                    self.requeue_segment(task, downloaded_bytes)
+                time.sleep(random.uniform(1, 3))
                 return
             
             # 下载完成统计
             download_duration = time.time() - start_time
+            if interrupted:
+                # 休息或时段结束时中断的分段，开闸后继续下载剩余部分（服务停止时队列在下次启动时清空）
+                if self.is_active(generation):
+                    self.requeue_segment(task, downloaded_bytes, failed=False)
+            else:
+                self.source_pool.record_success(url, downloaded_bytes, download_duration)
+                self.meter.count_download()
             if download_duration > 0:
                 avg_speed_mbps = (downloaded_bytes / download_duration / 1024 / 1024) * 8
-                self.logger.info(f"下载完成: {downloaded_bytes / 1024 / 1024:.1f} MB, 平均速度: {avg_speed_mbps:.2f} Mbps")
+                self.logger.info(f"[流{stream_id}] 下载完成: {downloaded_bytes / 1024 / 1024:.1f} MB, 平均速度: {avg_speed_mbps:.2f} Mbps",
+                                 extra=sampled(10))
             else:
-                self.logger.info(f"下载完成: {downloaded_bytes / 1024 / 1024:.1f} MB")
-            
-            # 清理资源
-            discard_buffer.close()
-            
-            # 下载完成后等待一段时间再开始下一个任务
-            if self.is_running:
-                time.sleep(random.uniform(2, 8))
+                self.logger.info(f"[流{stream_id}] 下载完成: {downloaded_bytes / 1024 / 1024:.1f} MB", extra=sampled(10))
             
         except Exception as e:
-            self.logger.info(f"下载错误: {e}")
+            self.logger.info(f"[流{stream_id}] 下载错误: {e}", extra=rate_limited(10))
+            if self.is_active(generation):
+                self.requeue_segment(task, downloaded_bytes)
             # 发生错误时等待更长时间
             time.sleep(random.uniform(10, 30))
     
     def get_status(self):
         """获取服务状态"""
+        today_bytes = self.refresh_today_bytes()
+        
         if not self.is_running:
             return {
                 "is_running": False,
                 "status": "stopped",
                 "speed_mbps": 0.0,
-                "today_bytes": self.today_total_bytes,
+                "today_bytes": today_bytes,
                 "today_quota_bytes": self.daily_quota_bytes,
                 "uptime_seconds": self.total_uptime_seconds
             }
@@ -271,52 +578,85 @@ class DownOnlyService:
         if self.start_time:
             uptime_seconds += int((datetime.now() - self.start_time).total_seconds())
         
-        # 检查是否超过配额
-        if self.today_total_bytes >= self.daily_quota_bytes:
-            self.stop_service()
-            self.logger.info("今日流量已达到配额，自动停止服务")
-            return {
-                "is_running": False,
-                "status": "quota_exceeded",
-                "speed_mbps": 0.0,
-                "today_bytes": self.today_total_bytes,
-                "today_quota_bytes": self.daily_quota_bytes,
-                "uptime_seconds": uptime_seconds
-            }
+        # 配额、时段和休息由调度器在后台处理，这里只读取状态
+        schedule = self.scheduler.get_info()
+        status = schedule["status"] if schedule["status"] != "stopped" else "running"
+        
+        meter = self.meter.snapshot()
         
-        # 添加调试日志
-        self.logger.info(f"状态调试: today_bytes={self.today_total_bytes}, current_speed={self.current_speed}")
+        # 每次状态轮询都会执行，只在调试级别记录
+        self.logger.debug(f"状态调试: today_bytes={today_bytes}, current_speed={meter['instant_mbps']}",
+                          extra=rate_limited(60))
         
         return {
             "is_running": True,
-            "status": "running",
-            "speed_mbps": round(self.current_speed, 2),
-            "today_bytes": self.today_total_bytes,
+            "status": status,
+            "speed_mbps": meter["instant_mbps"],
+            "speed_10s_mbps": meter["ewma_10s_mbps"],
+            "speed_60s_mbps": meter["ewma_60s_mbps"],
+            "bytes_per_cpu_second": meter["bytes_per_cpu_second"],
+            "download_count": meter["download_count"],
+            "speed_history": meter["speed_history"],
+            "today_bytes": today_bytes,
             "today_quota_bytes": self.daily_quota_bytes,
-            "uptime_seconds": uptime_seconds
+            "uptime_seconds": uptime_seconds,
+            "next_transition": schedule["next_transition"],
+            "engine": self.engine,
+            "concurrency": self.concurrency,
+            "speed_limit_mbps": round(self.rate_limiter.get_rate_mbps(), 2),
+            "pacing": schedule["pacing"],
+            "active_streams": meter["active_streams"]
         }
     
+    def get_sources(self):
+        """获取下载源健康评分"""
+        return {"sources": self.source_pool.get_scoreboard()}
+    
+    def resolve_month(self, month):
+        """月份参数对应的 (年, 月)，晚于当前月份的视为去年"""
+        today = datetime.now()
+        month = month if 1 <= month <= 12 else today.month
+        year = today.year if month <= today.month else today.year - 1
+        return year, month
+    
     def get_history(self, month):
-        """获取历史数据"""
-        # 生成模拟月度数据
-        days = list(range(1, 29))  # 28天
-        data = []
-        
-        for day in days:
-            # 随机生成每日流量
-            bytes_data = random.randint(100, 1000) * 1024 * 1024  # 100MB-1GB
-            data.append({"day": day, "bytes": bytes_data})
-        
-        return {"days": data}
+        """获取历史数据 - 月度每日流量（来自流量账本）"""
+        year, month = self.resolve_month(month)
+        return {"year": year, "month": month, "days": self.ledger.get_month(year, month)}
+    
+    def get_history_version(self, month):
+        """get_history() 结果的版本标识"""
+        self.ledger.ensure_loaded()
+        return self.resolve_month(month) + (self.ledger.today, self.ledger.version)
     
     def update_daily_quota(self, quota_gb):
-        """更新每日配额"""
-        self.daily_quota_bytes = quota_gb * 1024 * 1024 * 1024
-        self.logger.info(f"每日配额已更新为: {quota_gb} GB")
+        """更新每日配额 - 按新的最小/最大配额范围重新校验今日配额"""
+        self.logger.info(f"每日配额范围已更新，最小配额: {quota_gb} GB")
         
-        # 重新加载URL列表
+        # 重新加载配置（URL列表、调度参数），今日配额超出新范围时由调度器重新抽取
         self.update_urls_from_config()
 
+    def update_speed_limit(self, speed_limit_mbps):
+        """更新下载限速 (Mbps)，0 表示不限速"""
+        try:
+            self.speed_limit_mbps = max(0.0, float(speed_limit_mbps or 0))
+        except (TypeError, ValueError) as e:
+            self.logger.info(f"无效的限速配置 {speed_limit_mbps}: {e}")
+            return
+        self.apply_rate_limit(log=True)
+
+    def update_paced_rate(self, paced_rate_mbps):
+        """更新匀速下载目标速率 (Mbps)，None 表示取消匀速"""
+        self.paced_rate_mbps = paced_rate_mbps
+        self.apply_rate_limit(log=False)
+
+    def apply_rate_limit(self, log=False):
+        """实际限速 = min(用户限速, 匀速目标速率)"""
+        rate = self.speed_limit_mbps
+        if self.paced_rate_mbps is not None:
+            rate = min(rate, self.paced_rate_mbps) if rate > 0 else self.paced_rate_mbps
+        self.rate_limiter.set_rate(rate, log=log)
+
     def get_daily_quota_gb(self):
         """获取每日配额（GB）"""
         return int(self.daily_quota_bytes / (1024 * 1024 * 1024))
@@ -333,8 +673,17 @@ def get_status():
 def get_history(month):
     return downonly_service.get_history(month)
 
+def get_history_version(month):
+    return downonly_service.get_history_version(month)
+
+def get_sources():
+    return downonly_service.get_sources()
+
 def update_daily_quota(quota_gb):
     return downonly_service.update_daily_quota(quota_gb)
 
+def update_speed_limit(speed_limit_mbps):
+    return downonly_service.update_speed_limit(speed_limit_mbps)
+
 def get_daily_quota_gb():
     return downonly_service.get_daily_quota_gb()
\ No newline at end of file
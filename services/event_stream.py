@@ -0,0 +1,151 @@
+"""实时事件推送 - Server-Sent Events 扇出广播"""
+
+import json
+import queue
+import threading
+import logging
+
+
+CLOSED = object()  # 广播器关闭时发给所有订阅者，推送流收到后结束
+
+
+class Subscriber:
+    """一个SSE连接的消息队列 - 有界，慢客户端不会拖累广播"""
+
+    def __init__(self, max_pending=32):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.resync = False  # 队列溢出丢弃过消息，需要重新发送完整状态
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            # 丢弃积压的增量，改为下次发送完整快照
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.resync = True
+
+    def close(self):
+        """清空积压并放入结束标记"""
+        while True:
+            try:
+                self.queue.get_nowait()
+            except queue.Empty:
+                break
+        self.queue.put_nowait(CLOSED)
+
+    def next(self, timeout):
+        """等待下一条消息，超时返回None，广播器关闭时返回CLOSED"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroadcaster:
+    """扇出广播器 - 每条事件只序列化一次，分发给所有订阅者
+
+    每个推送连接在线程池服务器中长期占用一个工作线程，max_subscribers 限制推送连接数，
+    超出时拒绝订阅，客户端退回轮询。
+    """
+
+    def __init__(self, max_subscribers=None):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.max_subscribers = max_subscribers  # None 表示不限制
+        self.closed = False
+
+    @staticmethod
+    def format_event(event, data):
+        """编码为SSE消息"""
+        return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+    def subscribe(self):
+        """新增订阅者；已关闭或已达上限时返回None"""
+        subscriber = Subscriber()
+        with self.lock:
+            if self.closed or (self.max_subscribers is not None and len(self.subscribers) >= self.max_subscribers):
+                return None
+            self.subscribers.add(subscriber)
+            count = len(self.subscribers)
+        self.logger.info(f"实时推送订阅者加入，当前 {count} 个")
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            self.subscribers.discard(subscriber)
+            count = len(self.subscribers)
+        self.logger.info(f"实时推送订阅者离开，当前 {count} 个")
+
+    def has_subscribers(self):
+        return bool(self.subscribers)
+
+    def close(self):
+        """服务器关闭：结束所有推送流，释放它们占用的工作线程"""
+        with self.lock:
+            self.closed = True
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.close()
+
+    def publish(self, event, data):
+        message = self.format_event(event, data)
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            subscriber.offer(message)
+
+
+class LivePublisher:
+    """实时状态发布器 - 由网卡采样器每个节拍驱动
+
+    每个节拍发布一次所有网卡的统计（stats），以及流量黑洞状态相对上次发布的变化字段（downonly）。
+    没有订阅者时不做任何工作。
+    """
+
+    def __init__(self, broadcaster):
+        self.logger = logging.getLogger(__name__)
+        self.broadcaster = broadcaster
+        self.lock = threading.Lock()
+        self.last_downonly = None
+
+    def get_stats(self):
+        from services.monitor_service import get_all_stats
+        return get_all_stats()
+
+    def get_downonly(self):
+        from services.downonly_service import get_status
+        return get_status()
+
+    def snapshot(self):
+        """新连接或需要重新同步时发送的完整状态"""
+        return [("stats", self.get_stats()), ("downonly", self.get_downonly())]
+
+    def on_tick(self):
+        """采样器节拍回调"""
+        if not self.broadcaster.has_subscribers():
+            self.last_downonly = None
+            return
+        try:
+            self.broadcaster.publish("stats", self.get_stats())
+
+            status = self.get_downonly()
+            with self.lock:
+                last = self.last_downonly or {}
+                delta = {key: value for key, value in status.items() if last.get(key) != value}
+                # 服务停止后状态字段变少，已消失的字段发送null让客户端清除
+                delta.update({key: None for key in last if key not in status})
+                self.last_downonly = status
+            if delta:
+                self.broadcaster.publish("downonly", delta)
+        except Exception as e:
+            self.logger.info(f"实时推送失败: {e}")
+
+
+# 全局实例
+event_broadcaster = EventBroadcaster()
+live_publisher = LivePublisher(event_broadcaster)
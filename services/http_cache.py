@@ -0,0 +1,231 @@
+"""HTTP响应缓存与压缩 - 基于数据版本号的强ETag/304、gzip/brotli压缩、带内容指纹的静态文件
+
+- API的ETag由数据的版本号计算（配置快照、流量历史、网卡列表、流量账本），
+  If-None-Match命中时直接返回304，不执行查询也不序列化JSON
+- 超过阈值的文本类响应按Accept-Encoding压缩（brotli为可选依赖，未安装时只用gzip），
+  压缩后的表示使用带 -gzip/-br 后缀的ETag，与未压缩的表示区分
+- 静态文件的原文和压缩结果缓存在内存中，文件变化时重新读取；模板中 url_for('static', ...)
+  生成带内容指纹的文件名，指纹与当前内容一致时返回一年有效的immutable缓存头
+"""
+
+import os
+import re
+import gzip
+import uuid
+import hashlib
+import mimetypes
+import logging
+
+from flask import Response, jsonify, request
+from werkzeug.exceptions import NotFound
+from werkzeug.http import parse_etags
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+ENCODING_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "image/svg+xml")
+FINGERPRINT = re.compile(r"^(.+)\.([0-9a-f]{12})(\.[A-Za-z0-9]+)$")  # js/app.1a2b3c4d5e6f.js
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"  # 可以缓存，但每次使用前用ETag验证
+
+
+class StaticFile:
+    """一个静态文件的内存缓存 - 原文、内容指纹，各编码的压缩结果首次请求时生成"""
+
+    def __init__(self, signature, data, mimetype):
+        self.signature = signature  # (mtime_ns, size)，变化时重新读取
+        self.mimetype = mimetype
+        digest = hashlib.sha256(data).hexdigest()
+        self.fingerprint = digest[:12]
+        self.etag = digest[:24]
+        self.encoded = {None: data}
+
+    @property
+    def size(self):
+        return len(self.encoded[None])
+
+    @property
+    def compressible(self):
+        return self.mimetype.startswith(COMPRESSIBLE_TYPES)
+
+
+class HttpCache:
+    """响应缓存与压缩"""
+
+    def __init__(self, min_size=1024, gzip_level=6, brotli_quality=5):
+        self.logger = logging.getLogger(__name__)
+        self.min_size = min_size  # 小于该字节数的响应不压缩
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        # 重启后各数据的版本号从头计数，ETag加入启动标识，避免与重启前发出的ETag相同
+        self.boot_id = uuid.uuid4().hex[:8]
+        self.static_folder = None
+        self.static_files = {}  # {相对路径: StaticFile}
+
+    def init_app(self, app):
+        """接管静态文件视图，为静态文件URL加指纹，并压缩响应"""
+        self.static_folder = app.static_folder
+        app.view_functions['static'] = self.send_static
+        app.url_defaults(self.fingerprint_url)
+        app.after_request(self.compress_response)
+        encodings = "brotli, gzip" if brotli is not None else "gzip"
+        self.logger.info(f"HTTP响应压缩: {encodings}，阈值 {self.min_size} 字节")
+
+    def make_etag(self, version):
+        return hashlib.sha1(repr((self.boot_id, version)).encode()).hexdigest()[:24]
+
+    @staticmethod
+    def match_etag(etag):
+        """If-None-Match中与etag一致（忽略压缩后缀）的原始ETag，没有时返回None
+
+        304响应原样返回客户端缓存的ETag，客户端缓存的是哪种编码的表示都能对应上。
+        """
+        header = request.headers.get('If-None-Match')
+        if not header:
+            return None
+        etags = parse_etags(header)
+        if etags.star_tag:
+            return etag
+        for tag in etags.as_set(include_weak=True):
+            base = tag
+            for suffix in ENCODING_SUFFIXES.values():
+                if base.endswith(suffix):
+                    base = base[:-len(suffix)]
+                    break
+            if base == etag:
+                return tag
+        return None
+
+    @staticmethod
+    def not_modified_response(etag, cache_control):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def not_modified(self, version):
+        """请求的If-None-Match与version对应的ETag一致时返回304响应，否则返回None"""
+        if version is None:
+            return None
+        matched = self.match_etag(self.make_etag(version))
+        return self.not_modified_response(matched, REVALIDATE) if matched is not None else None
+
+    def cached_json(self, data, version):
+        """JSON响应，附带version对应的ETag；version为None时与jsonify相同"""
+        response = jsonify(data)
+        if version is not None:
+            response.set_etag(self.make_etag(version))
+            response.headers['Cache-Control'] = REVALIDATE
+        return response
+
+    @staticmethod
+    def choose_encoding():
+        """按Accept-Encoding选择压缩方式，客户端都不接受时返回None"""
+        options = ["br", "gzip"] if brotli is not None else ["gzip"]
+        return request.accept_encodings.best_match(options)
+
+    def encode(self, data, encoding):
+        if encoding == "br":
+            return brotli.compress(data, quality=self.brotli_quality)
+        # mtime=0 使相同内容的压缩结果完全相同
+        return gzip.compress(data, compresslevel=self.gzip_level, mtime=0)
+
+    def compress_response(self, response):
+        """after_request：压缩超过阈值的文本类响应（推送流、文件流和已压缩的响应除外）"""
+        if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+                or 'Content-Encoding' in response.headers
+                or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+        response.set_data(self.encode(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(etag + ENCODING_SUFFIXES[encoding], weak)
+        return response
+
+    def load_static(self, filename):
+        """读取静态文件，文件未变化时使用缓存；不存在时返回None"""
+        path = safe_join(self.static_folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        static_file = self.static_files.get(filename)
+        if static_file is not None and static_file.signature == signature:
+            return static_file
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        static_file = self.static_files[filename] = StaticFile(signature, data, mimetype)
+        return static_file
+
+    def fingerprint_url(self, endpoint, values):
+        """url_defaults：url_for('static', filename='js/app.js') 生成 js/app.<指纹>.js"""
+        if endpoint != 'static' or 'filename' not in values:
+            return
+        root, ext = os.path.splitext(values['filename'])
+        static_file = self.load_static(values['filename']) if ext else None
+        if static_file is not None:
+            values['filename'] = f"{root}.{static_file.fingerprint}{ext}"
+
+    def send_static(self, filename):
+        """静态文件视图：指纹与当前内容一致时长期缓存，其余每次用ETag验证"""
+        cache_control = REVALIDATE
+        static_file = self.load_static(filename)
+        if static_file is None:
+            match = FINGERPRINT.match(filename)
+            if match:
+                static_file = self.load_static(match.group(1) + match.group(3))
+                # 旧指纹（页面缓存了更新前的HTML）仍返回当前内容，但不长期缓存
+                if static_file is not None and static_file.fingerprint == match.group(2):
+                    cache_control = IMMUTABLE
+        if static_file is None:
+            raise NotFound()
+
+        matched = self.match_etag(static_file.etag)
+        if matched is not None:
+            return self.not_modified_response(matched, cache_control)
+
+        encoding = None
+        if static_file.compressible and static_file.size >= self.min_size:
+            encoding = self.choose_encoding()
+        body = static_file.encoded.get(encoding)
+        if body is None:
+            body = static_file.encoded[encoding] = self.encode(static_file.encoded[None], encoding)
+
+        response = Response(body, mimetype=static_file.mimetype)
+        response.headers['Cache-Control'] = cache_control
+        if static_file.compressible:
+            response.vary.add('Accept-Encoding')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+            response.set_etag(static_file.etag + ENCODING_SUFFIXES[encoding])
+        else:
+            response.set_etag(static_file.etag)
+        return response
+
+
+# 全局实例
+http_cache = HttpCache()
+
+def init_app(app):
+    return http_cache.init_app(app)
+
+def not_modified(version):
+    return http_cache.not_modified(version)
+
+def cached_json(data, version):
+    return http_cache.cached_json(data, version)
@@ -0,0 +1,216 @@
+"""网卡发现 - 监听rtnetlink的网卡/地址/路由变化事件，不可用时退回低频扫描/sys/class/net"""
+
+import os
+import socket
+import struct
+import threading
+import time
+import logging
+
+import psutil
+
+
+# rtnetlink 常量（linux/rtnetlink.h）
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+RTMGRP_IPV4_ROUTE = 0x40
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+NLMSG_HEADER = struct.Struct('=IHHII')  # 长度, 类型, 标志, 序号, 端口
+
+SYS_CLASS_NET = "/sys/class/net"
+PROC_NET_ROUTE = "/proc/net/route"
+DEFAULT_INTERFACES = ['enp2s0', 'enp3s0', 'NodeBabyLink']
+
+
+class InterfaceDiscovery:
+    """网卡发现 - 事件驱动地维护监测网卡集合
+
+    Linux上订阅rtnetlink的网卡、IPv4地址和路由变化组播，收到事件后重新扫描并与当前集合比较，
+    只把新增/移除的网卡通知订阅者；其他平台或无法创建netlink套接字时每30秒扫描一次。
+    扫描只读取/sys/class/net、/proc/net/route和一次getifaddrs，不创建子进程。
+    """
+
+    def __init__(self, poll_interval=30, debounce=0.5):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.poll_interval = poll_interval  # 没有netlink时的扫描间隔
+        self.debounce = debounce  # 合并短时间内的一串事件（如网卡up时连续的多条消息）
+        self.interfaces = []
+        self.default_interface = None  # IPv4默认路由所在网卡（流量黑洞的下载经由此网卡）
+        self.subscribers = []
+        self.running = False
+
+    @staticmethod
+    def is_ignored(interface):
+        # 跳过回环接口和虚拟网卡，但保留NodeBabyLink
+        return interface == 'lo' or interface.startswith(('docker', 'veth', 'br-'))
+
+    def scan(self):
+        """扫描当前应监测的网卡"""
+        # 方法1：有IPv4地址的网卡（一次getifaddrs获取所有网卡的地址）
+        addresses = psutil.net_if_addrs()
+        interfaces = [name for name, addrs in addresses.items()
+                      if not self.is_ignored(name) and any(addr.family == socket.AF_INET for addr in addrs)]
+        if interfaces:
+            return interfaces
+
+        # 方法2：/sys/class/net中已启用的网卡，enp*格式优先
+        try:
+            found = []
+            for name in sorted(os.listdir(SYS_CLASS_NET)):
+                if self.is_ignored(name):
+                    continue
+                try:
+                    with open(os.path.join(SYS_CLASS_NET, name, 'operstate')) as f:
+                        state = f.read().strip()
+                except OSError:
+                    continue
+                if state in ('up', 'unknown'):
+                    found.append(name)
+            interfaces = [name for name in found if name.startswith('enp')] + \
+                         [name for name in found if not name.startswith('enp')]
+        except OSError:
+            interfaces = []
+        if interfaces:
+            return interfaces
+
+        # 方法3：使用固定列表
+        self.logger.info("使用固定网卡列表")
+        return list(DEFAULT_INTERFACES)
+
+    def read_default_route(self):
+        """IPv4默认路由的出口网卡（多条时取metric最小的），读取失败返回None"""
+        try:
+            with open(PROC_NET_ROUTE) as f:
+                lines = f.read().splitlines()[1:]
+        except OSError:
+            return None
+        best = None
+        for line in lines:
+            # Iface Destination Gateway Flags RefCnt Use Metric Mask ...
+            fields = line.split()
+            if len(fields) < 8 or fields[1] != '00000000' or fields[7] != '00000000':
+                continue
+            metric = int(fields[6])
+            if best is None or metric < best[0]:
+                best = (metric, fields[0])
+        return best[1] if best else None
+
+    def refresh(self):
+        """重新扫描并增量更新网卡集合，有变化时通知订阅者；返回当前网卡列表"""
+        try:
+            interfaces = self.scan()
+        except Exception as e:
+            self.logger.info(f"获取网卡列表失败: {e}")
+            interfaces = self.interfaces or list(DEFAULT_INTERFACES)
+        default_interface = self.read_default_route()
+
+        with self.lock:
+            added = [name for name in interfaces if name not in self.interfaces]
+            removed = [name for name in self.interfaces if name not in interfaces]
+            self.interfaces = interfaces
+            if default_interface != self.default_interface:
+                self.logger.info(f"默认路由网卡: {default_interface}")
+                self.default_interface = default_interface
+            subscribers = list(self.subscribers)
+        if added or removed:
+            self.logger.info(f"网卡变化: 新增 {added}，移除 {removed}")
+            for callback in subscribers:
+                try:
+                    callback(interfaces, added, removed)
+                except Exception as e:
+                    self.logger.info(f"网卡变化通知失败: {e}")
+        return interfaces
+
+    def subscribe(self, callback):
+        """注册网卡变化回调 callback(当前列表, 新增, 移除)"""
+        with self.lock:
+            self.subscribers.append(callback)
+
+    def get_interfaces(self):
+        return self.interfaces
+
+    def get_default_interface(self):
+        return self.default_interface
+
+    def open_netlink(self):
+        """创建订阅网卡/地址/路由变化的rtnetlink套接字，不支持时返回None"""
+        if not hasattr(socket, 'AF_NETLINK'):
+            return None
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR | RTMGRP_IPV4_ROUTE))
+            return sock
+        except OSError as e:
+            self.logger.info(f"无法订阅rtnetlink事件，改为定期扫描: {e}")
+            return None
+
+    @staticmethod
+    def has_interface_event(data):
+        """消息中是否包含网卡、地址或路由的增删"""
+        offset = 0
+        while offset + NLMSG_HEADER.size <= len(data):
+            length, msg_type, _, _, _ = NLMSG_HEADER.unpack_from(data, offset)
+            if msg_type in (RTM_NEWLINK, RTM_DELLINK, RTM_NEWADDR, RTM_DELADDR, RTM_NEWROUTE, RTM_DELROUTE):
+                return True
+            if length < NLMSG_HEADER.size:
+                break
+            offset += (length + 3) & ~3  # NLMSG_ALIGN
+        return False
+
+    def watch_netlink(self, sock):
+        """阻塞等待rtnetlink事件，事件合并后重新扫描"""
+        self.logger.info("网卡发现: 监听rtnetlink事件")
+        while self.running:
+            try:
+                data = sock.recv(65536)
+            except OSError as e:
+                # 事件过多导致缓冲区溢出(ENOBUFS)时直接全量重新扫描
+                self.logger.info(f"rtnetlink接收失败: {e}")
+                self.refresh()
+                time.sleep(1)
+                continue
+            if not self.has_interface_event(data):
+                continue
+            # 等待一小段时间，把同一次变化产生的多条消息合并为一次扫描
+            sock.settimeout(self.debounce)
+            try:
+                while True:
+                    sock.recv(65536)
+            except OSError:
+                # 超时：这一串事件已收完
+                pass
+            finally:
+                sock.settimeout(None)
+            self.refresh()
+
+    def poll(self):
+        self.logger.info(f"网卡发现: 每 {self.poll_interval} 秒扫描一次")
+        while self.running:
+            time.sleep(self.poll_interval)
+            self.refresh()
+
+    def run(self):
+        sock = self.open_netlink()
+        try:
+            if sock is not None:
+                self.watch_netlink(sock)
+            else:
+                self.poll()
+        finally:
+            if sock is not None:
+                sock.close()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,224 @@
+"""网卡采样器 - 固定节拍后台采样，数据保存在紧凑的环形缓冲区中"""
+
+import time
+import threading
+import logging
+from array import array
+
+
+WRAP_32 = 1 << 32  # 部分虚拟网卡/旧驱动的计数器只有32位
+MAX_RATE = 12.5e9  # 可信速率上限 (字节/秒，100 Gbit/s)，超过视为计数器被重置为任意值
+MIN_WRAP_RATE = 1024 * 1024  # 判定回绕时允许的最低速率 (字节/秒)
+WRAP_RATE_FACTOR = 4  # 回绕后的速率不超过上一样本速率的倍数
+
+# 样本标志：该样本与上一个样本之间发生了计数器重置/回绕
+FLAG_RECV_RESET = 1
+FLAG_SENT_RESET = 2
+FLAG_RECV_WRAP = 4
+FLAG_SENT_WRAP = 8
+FLAG_RESET = FLAG_RECV_RESET | FLAG_SENT_RESET
+
+
+def counter_delta(previous, current, dt, recent_rate, max_rate=MAX_RATE):
+    """计算单向累计计数器的增量，返回 (增量, 事件)，事件为 None / "wrap" / "reset"
+
+    - 正常递增：差值，但超过 max_rate 时视为计数器被重置为任意值，重新建立基线（增量记0）
+    - 变小且上一读数在32位范围内，按回绕计算的速率与最近速率相符：32位回绕
+    - 其他变小：重置（网卡重建、驱动重载），计数器从0重新开始，当前读数即重置后的流量
+    """
+    limit = max_rate * dt
+    if current >= previous:
+        delta = current - previous
+        return (delta, None) if delta <= limit else (0, "reset")
+    if previous < WRAP_32:
+        wrapped = WRAP_32 - previous + current
+        if wrapped <= max(WRAP_RATE_FACTOR * recent_rate, MIN_WRAP_RATE) * dt:
+            return wrapped, "wrap"
+    return (current if current <= limit else 0), "reset"
+
+
+class InterfaceRing:
+    """单个网卡的采样环形缓冲区 - 预分配的array，内存大小固定"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array('d', [0.0]) * capacity  # 采样时间 (unix秒)
+        self.bytes_recv = array('Q', [0]) * capacity  # 累计接收字节
+        self.bytes_sent = array('Q', [0]) * capacity  # 累计发送字节
+        self.recv_rate = array('d', [0.0]) * capacity  # 接收速率 (字节/秒)
+        self.sent_rate = array('d', [0.0]) * capacity  # 发送速率 (字节/秒)
+        self.flags = array('B', [0]) * capacity  # FLAG_* 计数器重置/回绕标志
+        self.head = -1  # 最新样本的位置
+        self.count = 0
+        self.last_monotonic = None
+        self.resets = 0  # 累计检测到的重置/回绕次数
+        self.wraps = 0
+
+    def append(self, timestamp, monotonic, bytes_recv, bytes_sent):
+        """追加样本，速率按与上一个样本的单调时钟间隔计算
+
+        返回与上一个样本的增量 (接收, 发送, 标志)；计数器重置/回绕时增量已修正，不会出现负值或跳变。
+        """
+        recv_delta = sent_delta = 0
+        recv_rate = sent_rate = 0.0
+        flags = 0
+        if self.count and monotonic > self.last_monotonic:
+            dt = monotonic - self.last_monotonic
+            i = self.head
+            recv_delta, recv_event = counter_delta(self.bytes_recv[i], bytes_recv, dt, self.recv_rate[i])
+            sent_delta, sent_event = counter_delta(self.bytes_sent[i], bytes_sent, dt, self.sent_rate[i])
+            for event, reset_flag, wrap_flag in ((recv_event, FLAG_RECV_RESET, FLAG_RECV_WRAP),
+                                                 (sent_event, FLAG_SENT_RESET, FLAG_SENT_WRAP)):
+                if event == "reset":
+                    flags |= reset_flag
+                    self.resets += 1
+                elif event == "wrap":
+                    flags |= wrap_flag
+                    self.wraps += 1
+            recv_rate = recv_delta / dt
+            sent_rate = sent_delta / dt
+
+        self.head = (self.head + 1) % self.capacity
+        self.times[self.head] = timestamp
+        self.bytes_recv[self.head] = bytes_recv
+        self.bytes_sent[self.head] = bytes_sent
+        self.recv_rate[self.head] = recv_rate
+        self.sent_rate[self.head] = sent_rate
+        self.flags[self.head] = flags
+        self.count = min(self.count + 1, self.capacity)
+        self.last_monotonic = monotonic
+        return recv_delta, sent_delta, flags
+
+    def latest(self):
+        """最新样本，O(1)"""
+        if not self.count:
+            return None
+        i = self.head
+        return {
+            "time": self.times[i],
+            "bytes_recv": self.bytes_recv[i],
+            "bytes_sent": self.bytes_sent[i],
+            "recv_rate": self.recv_rate[i],
+            "sent_rate": self.sent_rate[i],
+            "flags": self.flags[i]
+        }
+
+
+class InterfaceSampler:
+    """网卡采样器 - 每个节拍一次性读取所有网卡计数器，与访问的客户端数量无关"""
+
+    def __init__(self, get_interfaces, counter_reader, history=None, interval=1.0, capacity=600):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.get_interfaces = get_interfaces  # 返回需要采样的网卡名列表
+        self.counter_reader = counter_reader  # 网卡计数器读取后端，read(网卡列表) -> {网卡: (接收, 发送)}
+        self.interval = interval
+        self.capacity = capacity  # 默认保留10分钟的秒级样本
+        # 增量消费者：每个样本与上一个样本的字节增量依次传给 add(网卡, 时间, 接收, 发送)，如多分辨率流量历史
+        self.consumers = [history] if history is not None else []
+        self.rings = {}
+        self.sources = {}  # 非网卡的累计字节计数器 {名称: read() -> (接收, 发送)}，与网卡同一节拍采样
+        self.listeners = []  # 每个节拍采样完成后调用（如实时推送）
+        self.running = False
+
+    def sample(self):
+        """采集一次所有监测的网卡"""
+        interfaces = list(self.get_interfaces())
+        counters = self.counter_reader.read(interfaces)
+        for name, read in list(self.sources.items()):
+            try:
+                counters[name] = read()
+            except Exception as e:
+                self.logger.info(f"读取计数器 {name} 失败: {e}")
+            else:
+                interfaces.append(name)
+        timestamp = time.time()
+        monotonic = time.monotonic()
+        with self.lock:
+            for interface in interfaces:
+                if interface not in counters:
+                    continue
+                ring = self.rings.get(interface)
+                if ring is None:
+                    ring = self.rings[interface] = InterfaceRing(self.capacity)
+                bytes_recv, bytes_sent = counters[interface]
+                recv_delta, sent_delta, flags = ring.append(timestamp, monotonic, bytes_recv, bytes_sent)
+                if flags:
+                    # 以新读数为基线继续，增量已修正，历史和计费统计不受影响
+                    self.logger.info(f"网卡 {interface} 计数器{'重置' if flags & FLAG_RESET else '回绕'}"
+                                     f"（标志 {flags}），已重新建立基线")
+                if ring.count > 1:
+                    for consumer in self.consumers:
+                        consumer.add(interface, timestamp, recv_delta, sent_delta)
+
+    def run(self):
+        """采样线程 - 按固定节拍对齐，不因单次采样耗时而漂移"""
+        self.logger.info(f"网卡采样器启动，采样间隔 {self.interval} 秒")
+        # 对齐到整秒边界，使每个样本落在各自的秒级时间桶中
+        time.sleep(self.interval - time.time() % self.interval)
+        next_tick = time.monotonic()
+        while self.running:
+            try:
+                self.sample()
+            except Exception as e:
+                self.logger.info(f"网卡采样失败: {e}")
+            for listener in self.listeners:
+                try:
+                    listener()
+                except Exception as e:
+                    self.logger.info(f"采样节拍回调失败: {e}")
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                # 落后超过一个节拍时重新对齐，不补采
+                next_tick = time.monotonic()
+                delay = 0
+            time.sleep(delay)
+
+    def add_source(self, name, read):
+        """注册额外的累计字节计数器，按网卡同样的方式保存样本和历史（如流量黑洞自身的下载量）"""
+        self.sources[name] = read
+
+    def add_consumer(self, consumer):
+        """注册增量消费者（如计费统计），在采样线程中持锁调用，应尽快返回"""
+        self.consumers.append(consumer)
+
+    def add_listener(self, callback):
+        """注册节拍回调，在采样线程中调用，应尽快返回"""
+        self.listeners.append(callback)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def stop(self):
+        self.running = False
+
+    def remove_interfaces(self, interfaces):
+        """释放已不再监测的网卡的环形缓冲区"""
+        with self.lock:
+            for interface in interfaces:
+                self.rings.pop(interface, None)
+
+    def snapshot(self, interfaces):
+        """一次加锁读取多个网卡的最新样本，返回 (采样时间, {网卡: 样本})
+
+        同一节拍内所有网卡共用一个采样时间，因此结果在网卡之间是一致的。
+        """
+        with self.lock:
+            samples = {}
+            for interface in interfaces:
+                ring = self.rings.get(interface)
+                sample = ring.latest() if ring else None
+                if sample is not None:
+                    samples[interface] = sample
+        timestamp = max((sample["time"] for sample in samples.values()), default=None)
+        return timestamp, samples
+
+    def latest(self, interface):
+        """网卡的最新样本，尚未采到时返回None"""
+        with self.lock:
+            ring = self.rings.get(interface)
+            return ring.latest() if ring else None
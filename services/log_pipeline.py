@@ -0,0 +1,141 @@
+"""异步日志 - 调用线程只把日志记录放入有界队列，由单独的写日志线程写文件和控制台
+
+NAS的机械硬盘写入可能停顿数百毫秒，同步的文件Handler会让下载线程和HTTP工作线程一起等待。
+这里的写入全部在QueueListener线程中完成；队列满时丢弃并计数，调用线程永不阻塞。
+
+高频调用位置（下载进度、状态轮询等）通过extra参数按调用位置限流或抽样：
+    self.logger.info(f"...", extra=rate_limited(10))  # 该位置每10秒最多一条
+    self.logger.info(f"...", extra=sampled(20))       # 该位置每20条记录一条
+被省略的条数附加在该位置下一条输出的日志后面。werkzeug访问日志中成功的请求同样按抽样记录。
+"""
+
+import queue
+import atexit
+import threading
+import time
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+
+def rate_limited(seconds):
+    """extra参数：同一调用位置每seconds秒最多记录一条"""
+    return {"rate_limit": seconds}
+
+
+def sampled(every):
+    """extra参数：同一调用位置每every条记录一条"""
+    return {"sample_every": every}
+
+
+class CallSiteThrottle(logging.Filter):
+    """按调用位置（文件, 行号）限流/抽样，只处理带 rate_limit / sample_every 的记录"""
+
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.sites = {}  # {(文件, 行号): [上次输出时间, 计数, 已省略条数]}
+
+    def filter(self, record):
+        interval = getattr(record, "rate_limit", None)
+        every = getattr(record, "sample_every", None)
+        if interval is None and every is None:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            site = self.sites.get(key)
+            if site is None:
+                site = self.sites[key] = [None, 0, 0]
+            site[1] += 1
+            allowed = ((interval is None or site[0] is None or now - site[0] >= interval)
+                       and (every is None or (site[1] - 1) % every == 0))
+            if not allowed:
+                site[2] += 1
+                return False
+            site[0] = now
+            suppressed, site[2] = site[2], 0
+        if suppressed:
+            record.msg = f"{record.getMessage()}（此前省略 {suppressed} 条）"
+            record.args = None
+        return True
+
+
+class AccessLogSampler(logging.Filter):
+    """werkzeug访问日志：成功的请求（主要是前端每秒的轮询）抽样记录，其余状态码全部记录"""
+
+    def __init__(self, every):
+        super().__init__()
+        self.every = every
+
+    def filter(self, record):
+        # werkzeug的访问日志参数为 (请求行, 状态码, 大小)
+        args = record.args
+        if isinstance(args, tuple) and len(args) == 3 and str(args[1]) in ("200", "304"):
+            record.sample_every = self.every
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """放入有界队列，队列已满时丢弃并计数，不阻塞调用线程"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            return
+        if self.dropped:
+            dropped, self.dropped = self.dropped, 0
+            notice = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       f"日志队列已满，丢弃了 {dropped} 条日志", None, None)
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                self.dropped += dropped
+
+
+class LogPipeline:
+    """异步日志管道 - 根日志器只挂一个队列Handler，实际的Handler由写日志线程调用"""
+
+    def __init__(self, max_pending=10000):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.listener = None
+
+    def start(self, logger, handlers, access_log_every=20):
+        """把logger的输出改为经过队列，handlers在写日志线程中执行
+
+        access_log_every: 成功请求的访问日志每多少条记录一条，1表示全部记录
+        """
+        queue_handler = DroppingQueueHandler(self.queue)
+        queue_handler.addFilter(CallSiteThrottle())
+        logger.addHandler(queue_handler)
+        if access_log_every > 1:
+            logging.getLogger("werkzeug").addFilter(AccessLogSampler(access_log_every))
+        self.listener = QueueListener(self.queue, *handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        """写完队列中剩余的日志后停止写日志线程"""
+        if self.listener is None:
+            return
+        listener, self.listener = self.listener, None
+        try:
+            listener.stop()
+        except queue.Full:
+            # 队列已满放不下结束标记，写日志线程是守护线程，随进程退出
+            pass
+
+
+# 全局实例
+log_pipeline = LogPipeline()
+
+def start(logger, handlers, access_log_every=20):
+    return log_pipeline.start(logger, handlers, access_log_every)
+
+def stop():
+    return log_pipeline.stop()
@@ -0,0 +1,131 @@
+"""流量计量 - 分片字节计数器与EWMA速率"""
+
+import math
+import threading
+import time
+import logging
+from collections import deque
+
+
+class StreamCounter:
+    """单个下载流的字节计数分片，只有该流写入，避免所有流争用同一把锁"""
+
+    __slots__ = ("lock", "bytes", "last_bytes", "rate_mbps")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.last_bytes = 0  # 上次汇总时的读数（仅汇总线程使用）
+        self.rate_mbps = 0.0  # 上个汇总周期内的速率
+
+    def add(self, nbytes):
+        with self.lock:
+            self.bytes += nbytes
+
+    def read(self):
+        with self.lock:
+            return self.bytes
+
+
+class ThroughputMeter:
+    """吞吐量计量器 - 下载流写各自的分片，汇总线程按单调时钟定期合并
+
+    报告瞬时速率（最近一个汇总周期）、10秒/60秒EWMA速率，
+    以及每CPU秒处理的字节数（进程CPU时间）。
+    """
+
+    def __init__(self, history_size=30):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.history_size = history_size
+        self.shards = {}
+        self.retired_bytes = 0  # 已清零的分片累计的字节，使read_total在服务重启后仍单调递增
+        self.reset()
+
+    def reset(self):
+        """服务启动时清零"""
+        with self.lock:
+            self.retired_bytes += sum(shard.read() for shard in self.shards.values())
+            self.shards = {}
+            self.download_count = 0
+            self.total_bytes = 0
+            self.instant_mbps = 0.0
+            self.ewma_10s_mbps = 0.0
+            self.ewma_60s_mbps = 0.0
+            self.bytes_per_cpu_second = 0.0
+            self.history = deque(maxlen=self.history_size)  # 定长环形缓冲区，保存每秒速率
+            self.last_tick = time.monotonic()
+            self.last_cpu = time.process_time()
+            self.last_total = 0
+
+    def shard(self, stream_id):
+        """获取下载流的计数分片（流编号复用时沿用原分片）"""
+        shard = self.shards.get(stream_id)
+        if shard is None:
+            with self.lock:
+                shard = self.shards.setdefault(stream_id, StreamCounter())
+        return shard
+
+    def add(self, stream_id, nbytes):
+        self.shard(stream_id).add(nbytes)
+
+    def count_download(self):
+        """一次下载（文件或分段）完成"""
+        with self.lock:
+            self.download_count += 1
+
+    def read_total(self):
+        """进程启动以来下载的总字节数（单调递增），供网卡采样器在同一节拍读取"""
+        with self.lock:
+            shards = list(self.shards.values())
+            retired = self.retired_bytes
+        return retired + sum(shard.read() for shard in shards)
+
+    @staticmethod
+    def ewma(old, value, dt, tau):
+        """按实际时间间隔折算的EWMA，汇总周期抖动时仍保持时间常数"""
+        alpha = 1.0 - math.exp(-dt / tau)
+        return old + alpha * (value - old)
+
+    def tick(self):
+        """汇总所有分片，更新速率和速度历史（由汇总线程每秒调用）"""
+        now = time.monotonic()
+        cpu = time.process_time()
+        with self.lock:
+            dt = now - self.last_tick
+            if dt <= 0:
+                return
+            total = 0
+            for shard in self.shards.values():
+                current = shard.read()
+                shard.rate_mbps = (current - shard.last_bytes) * 8 / dt / 1000 / 1000
+                shard.last_bytes = current
+                total += current
+
+            delta = total - self.last_total
+            self.instant_mbps = delta * 8 / dt / 1000 / 1000
+            self.ewma_10s_mbps = self.ewma(self.ewma_10s_mbps, self.instant_mbps, dt, 10.0)
+            self.ewma_60s_mbps = self.ewma(self.ewma_60s_mbps, self.instant_mbps, dt, 60.0)
+            cpu_seconds = cpu - self.last_cpu
+            if cpu_seconds > 0:
+                self.bytes_per_cpu_second = delta / cpu_seconds
+            self.total_bytes = total
+            self.history.append(round(self.instant_mbps, 2))
+            self.last_tick = now
+            self.last_cpu = cpu
+            self.last_total = total
+
+    def snapshot(self):
+        """当前计量结果"""
+        with self.lock:
+            return {
+                "instant_mbps": round(self.instant_mbps, 2),
+                "ewma_10s_mbps": round(self.ewma_10s_mbps, 2),
+                "ewma_60s_mbps": round(self.ewma_60s_mbps, 2),
+                "bytes_per_cpu_second": int(self.bytes_per_cpu_second),
+                "total_bytes": self.total_bytes,
+                "download_count": self.download_count,
+                "active_streams": sum(1 for shard in self.shards.values() if shard.rate_mbps > 0),
+                "stream_speeds": {stream_id: round(shard.rate_mbps, 2) for stream_id, shard in self.shards.items()},
+                "speed_history": list(self.history)
+            }
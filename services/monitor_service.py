@@ -1,13 +1,90 @@
 """网卡监测服务 - 修复版 - 支持真实网卡名称和流量黑洞流量"""
 
 import psutil
+import os
 import time
 import threading
 from datetime import datetime, timedelta
 import logging
-import random
-import subprocess
-import socket
+
+from services.interface_sampler import InterfaceSampler, FLAG_RESET
+from services.interface_discovery import InterfaceDiscovery
+from services.traffic_history import TrafficHistory
+from services.usage_aggregator import UsageAggregator
+
+
+# 流量黑洞自身下载量在采样器和流量历史中的序列名（不会与网卡名冲突）
+BLACKHOLE_SERIES = "@blackhole"
+
+
+class PsutilCounterReader:
+    """网卡计数器读取 - psutil（通用后备方案，每次为所有网卡构造namedtuple）"""
+    
+    name = "psutil"
+    
+    def read(self, interfaces):
+        """返回 {网卡: (接收字节, 发送字节)}，只包含interfaces中存在的网卡"""
+        counters = psutil.net_io_counters(pernic=True) or {}
+        return {name: (counters[name].bytes_recv, counters[name].bytes_sent)
+                for name in interfaces if name in counters}
+
+
+class ProcNetDevReader:
+    """网卡计数器读取 - 保持/proc/net/dev文件描述符打开，每次用os.pread从头重读
+    
+    只解析需要监测的网卡所在的行，docker/veth等大量无关网卡不做任何解析。
+    """
+    
+    name = "procfs"
+    PATH = "/proc/net/dev"
+    
+    def __init__(self):
+        self.fd = os.open(self.PATH, os.O_RDONLY)
+        self.buffer_size = 64 * 1024
+        self.keys = {}  # {网卡: b"网卡:"}
+    
+    def read_all(self):
+        """读取整个文件；procfs每次从偏移0读取都会重新生成内容"""
+        data = os.pread(self.fd, self.buffer_size, 0)
+        while len(data) >= self.buffer_size:
+            # 网卡很多时扩大缓冲区，下次一次读完
+            self.buffer_size *= 2
+            data = os.pread(self.fd, self.buffer_size, 0)
+        return data
+    
+    def read(self, interfaces):
+        """返回 {网卡: (接收字节, 发送字节)}，只包含interfaces中存在的网卡"""
+        data = self.read_all()
+        counters = {}
+        for name in interfaces:
+            key = self.keys.get(name)
+            if key is None:
+                key = self.keys[name] = name.encode() + b":"
+            start = data.find(key)
+            # 网卡名前面只能是空格或换行，排除名称后缀相同的网卡（如 eth0 与 veth0）
+            while start > 0 and data[start - 1] not in b" \n":
+                start = data.find(key, start + 1)
+            if start < 0:
+                continue
+            end = data.find(b"\n", start)
+            fields = data[start + len(key):end if end >= 0 else None].split()
+            # 接收: bytes packets errs drop fifo frame compressed multicast | 发送: bytes ...
+            counters[name] = (int(fields[0]), int(fields[8]))
+        return counters
+    
+    def close(self):
+        os.close(self.fd)
+
+
+def create_counter_reader():
+    """优先使用/proc/net/dev，不可用时（非Linux、容器限制等）退回psutil"""
+    try:
+        reader = ProcNetDevReader()
+        reader.read([])
+        return reader
+    except OSError:
+        return PsutilCounterReader()
+
 
 class MonitorService:
     """网卡监测服务 - 修复版 - 支持真实网卡名称和流量黑洞流量"""
@@ -15,290 +92,184 @@ class MonitorService:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         self.interfaces = []
-        self.interface_stats = {}
-        self.last_stats = {}
+        self.interfaces_version = 0  # 网卡列表每次更新加一，用于HTTP ETag
         self.lock = threading.Lock()
         self.running = True
         
-        # 初始化时获取真实网卡列表
+        # 后台固定节拍采样所有网卡，get_stats只读取最新样本
+        self.history = TrafficHistory()  # 秒/分钟/小时三级流量历史，由采样器增量写入
+        self.counter_reader = create_counter_reader()
+        self.logger.info(f"网卡计数器读取方式: {self.counter_reader.name}")
+        self.sampler = InterfaceSampler(self.get_interfaces, self.counter_reader, history=self.history, interval=1.0)
+        self.sampler.add_source(BLACKHOLE_SERIES, self.read_blackhole_counter)
+        self.usage = UsageAggregator()  # 日/月总量与5分钟速率分位数，由采样器增量更新
+        self.sampler.add_consumer(self.usage)
+        
+        # 初始化时获取真实网卡列表，之后由rtnetlink事件驱动更新
+        self.discovery = InterfaceDiscovery()
+        self.discovery.subscribe(self.on_interfaces_changed)
         self.refresh_interfaces()
         
     def refresh_interfaces(self):
-        """刷新网卡列表 - 改进版，支持真实网卡名称"""
-        try:
-            # 方法1：使用psutil获取网卡列表
-            all_interfaces = psutil.net_if_addrs().keys()
-            self.interfaces = []
-            
-            for interface in all_interfaces:
-                # 跳过回环接口和虚拟网卡，但保留NodeBabyLink
-                if interface == 'lo':
-                    continue
-                if interface.startswith('docker') or interface.startswith('veth') or interface.startswith('br-'):
-                    continue
-                    
-                # 检查是否有IPv4地址
-                addrs = psutil.net_if_addrs().get(interface, [])
-                has_ipv4 = any(addr.family == socket.AF_INET for addr in addrs)
-                
-                if has_ipv4:
-                    self.interfaces.append(interface)
-                    
-            # 方法2：如果psutil找不到网卡，使用ip命令获取
-            if not self.interfaces:
-                self.logger.info("使用ip命令获取网卡列表")
-                result = subprocess.run(['ip', 'link', 'show'], capture_output=True, text=True)
-                if result.returncode == 0:
-                    for line in result.stdout.split('\n'):
-                        if ': ' in line and 'UP' in line:
-                            interface = line.split(':')[1].strip().split('@')[0]
-                            if interface != 'lo':
-                                self.interfaces.append(interface)
-            
-            # 方法3：如果还是没有，尝试包含NodeBabyLink和其他网卡
-            if not self.interfaces:
-                self.logger.info("尝试包含NodeBabyLink和其他网卡")
-                # 检查是否有enp*格式的网卡（您的NAS可能使用这种格式）
-                result = subprocess.run(['ip', 'link', 'show'], capture_output=True, text=True)
-                if result.returncode == 0:
-                    interfaces_found = []
-                    for line in result.stdout.split('\n'):
-                        if ': ' in line and 'UP' in line:
-                            interface = line.split(':')[1].strip().split('@')[0]
-                            if interface != 'lo':
-                                interfaces_found.append(interface)
-                    
-                    # 如果找到enp*网卡，优先使用
-                    enp_interfaces = [i for i in interfaces_found if i.startswith('enp')]
-                    other_interfaces = [i for i in interfaces_found if not i.startswith('enp') and i != 'lo']
-                    
-                    self.interfaces = enp_interfaces + other_interfaces
-                    
-                    # 确保至少有NodeBabyLink
-                    if 'NodeBabyLink' not in self.interfaces and interfaces_found:
-                        self.interfaces.append('NodeBabyLink')
-                
-                # 如果还是没有，使用固定列表
-                if not self.interfaces:
-                    self.logger.info("使用固定网卡列表")
-                    self.interfaces = ['enp2s0', 'enp3s0', 'NodeBabyLink']
-                    
-        except Exception as e:
-            self.logger.info(f"获取网卡列表失败: {e}")
-            # 使用默认列表
-            self.interfaces = ['enp2s0', 'enp3s0', 'NodeBabyLink']
+        """刷新网卡列表 - 由网卡发现组件扫描，变化时增量通知采样器"""
+        self.interfaces = self.discovery.refresh()
+        self.interfaces_version += 1
+    
+    def on_interfaces_changed(self, interfaces, added, removed):
+        """网卡发现回调：更新监测列表，释放已移除网卡的采样缓冲区"""
+        self.interfaces = interfaces
+        self.interfaces_version += 1
+        self.sampler.remove_interfaces(removed)
     
     def get_interfaces(self):
         """获取网卡列表"""
         return self.interfaces
     
+    def get_interfaces_version(self):
+        return self.interfaces_version
+    
+    def read_blackhole_counter(self):
+        """流量黑洞下载引擎自身统计的累计下载字节 (接收, 发送)，由采样器与网卡计数器同一节拍读取"""
+        from services.downonly_service import downonly_service
+        return downonly_service.meter.read_total(), 0
+    
+    def get_blackhole_interface(self):
+        """承载流量黑洞下载的网卡（IPv4默认路由网卡）"""
+        return self.discovery.get_default_interface()
+    
+    def format_stats(self, interface, sample, blackhole=None):
+        """把采样器样本转换为接口返回格式（总量MB，速率KB/s）
+        
+        速率为网卡计数器的实测值，不做任何修正。blackhole为流量黑洞在同一节拍的样本，
+        仅传给承载其下载的网卡：blackhole_recv_rate 为下载引擎统计的载荷速率，
+        foreground_recv_rate = 实测接收速率 - blackhole_recv_rate（其中仍包含黑洞流量的TCP/IP头部开销）。
+        gap 表示该样本与上一个样本之间网卡计数器被重置，速率只含重置后的流量。
+        """
+        recv_rate = sample['recv_rate']
+        blackhole_rate = blackhole['recv_rate'] if blackhole is not None else 0.0
+        return {
+            "interface": interface,
+            "total_sent": round(sample['bytes_sent'] / 1024 / 1024, 2),
+            "total_recv": round(sample['bytes_recv'] / 1024 / 1024, 2),
+            "sent_rate": round(sample['sent_rate'] / 1024, 2),
+            "recv_rate": round(recv_rate / 1024, 2),
+            "blackhole_recv_rate": round(blackhole_rate / 1024, 2),
+            "foreground_recv_rate": round(max(0.0, recv_rate - blackhole_rate) / 1024, 2),
+            "gap": bool(sample['flags'] & FLAG_RESET)
+        }
+    
     def get_stats(self, interface):
-        """获取网卡实时统计 - 修复版，包含流量黑洞流量"""
+        """获取网卡实时统计 - 实测速率，以及流量黑洞/前台流量的拆分"""
         try:
             if interface not in self.interfaces:
                 return {"error": f"Interface {interface} not found"}
             
-            # 获取当前网络统计
-            net_io = psutil.net_io_counters(pernic=True)
-            
-            # 如果psutil不可用，使用备用方法
-            if not net_io or interface not in net_io:
-                # 使用默认数据，但要考虑流量黑洞的影响
-                return self.get_mock_stats_with_downonly(interface)
+            # 读取后台采样器的最新样本，不在请求中读取内核计数器
+            timestamp, samples = self.sampler.snapshot([interface, BLACKHOLE_SERIES])
+            if interface not in samples:
+                return {"error": f"Interface {interface} has no samples yet"}
             
-            current_io = net_io[interface]
-            current_time = time.time()
-            
-            # 初始化或更新统计数据
-            with self.lock:
-                if interface not in self.last_stats:
-                    self.last_stats[interface] = {
-                        'bytes_sent': current_io.bytes_sent,
-                        'bytes_recv': current_io.bytes_recv,
-                        'time': current_time
-                    }
-                    
-                    # 返回初始统计
-                    return {
-                        "interface": interface,
-                        "total_sent": round(current_io.bytes_sent / 1024 / 1024, 2),
-                        "total_recv": round(current_io.bytes_recv / 1024 / 1024, 2),
-                        "sent_rate": 0.0,
-                        "recv_rate": 0.0
-                    }
-                
-                last_io = self.last_stats[interface]
-                time_diff = current_time - last_io['time']
-                
-                # 检查流量黑洞是否正在运行，如果是，增加额外的接收速率
-                recv_rate = 0.0
-                if time_diff > 0:
-                    base_recv_rate = (current_io.bytes_recv - last_io['bytes_recv']) / 1024 / time_diff
-                    
-                    # 如果流量黑洞正在运行，增加额外的下载速率
-                    try:
-                        from services.downonly_service import get_status as downonly_status
-                        downonly_info = downonly_status()
-                        if downonly_info.get('is_running'):
-                            # 添加基于真实下载流量的速率
-                            downonly_speed_mbps = downonly_info.get('speed_mbps', 0)
-                            # 将Mbps转换为KB/s (1 Mbps = 125 KB/s)
-                            additional_rate = downonly_speed_mbps * 125
-                            recv_rate = base_recv_rate + additional_rate
-                        else:
-                            recv_rate = base_recv_rate
-                    except:
-                        recv_rate = base_recv_rate
-                else:
-                    recv_rate = 0.0
-                
-                sent_rate = (current_io.bytes_sent - last_io['bytes_sent']) / 1024 / time_diff if time_diff > 0 else 0.0
-                
-                # 更新上一次的统计
-                self.last_stats[interface] = {
-                    'bytes_sent': current_io.bytes_sent,
-                    'bytes_recv': current_io.bytes_recv,
-                    'time': current_time
-                }
-                
-                return {
-                    "interface": interface,
-                    "total_sent": round(current_io.bytes_sent / 1024 / 1024, 2),
-                    "total_recv": round(current_io.bytes_recv / 1024 / 1024, 2),
-                    "sent_rate": round(sent_rate, 2),
-                    "recv_rate": round(recv_rate, 2)
-                }
+            blackhole = samples.get(BLACKHOLE_SERIES) if interface == self.get_blackhole_interface() else None
+            return self.format_stats(interface, samples[interface], blackhole)
                 
         except Exception as e:
-            return self.get_mock_stats_with_downonly(interface)
+            return {"error": str(e)}
     
-    def get_mock_stats(self, interface):
-        """获取模拟统计数据"""
-        try:
-            # 生成模拟数据
-            sent_rate = random.uniform(0, 100)
-            recv_rate = random.uniform(0, 150)
-            
-            # 生成累计数据
-            current_time = time.time()
-            if interface not in self.last_stats:
-                self.last_stats[interface] = {
-                    'bytes_sent': random.randint(1000000, 10000000),
-                    'bytes_recv': random.randint(2000000, 20000000),
-                    'time': current_time
-                }
-            
-            last_io = self.last_stats[interface]
-            time_diff = current_time - last_io['time']
-            
-            if time_diff > 0:
-                sent_bytes = last_io['bytes_sent'] + sent_rate * 1024 * time_diff
-                recv_bytes = last_io['bytes_recv'] + recv_rate * 1024 * time_diff
+    def get_all_stats(self, interfaces=None):
+        """批量获取网卡实时统计 - 所有网卡取自同一次采样，时间戳一致
+        
+        interfaces: 需要的网卡列表，None表示所有监测的网卡；未知网卡返回error条目。
+        blackhole 为流量黑洞下载引擎统计的同一节拍的下载量及其所在网卡。
+        """
+        requested = list(self.interfaces) if not interfaces else interfaces
+        timestamp, samples = self.sampler.snapshot(requested + [BLACKHOLE_SERIES])
+        blackhole = samples.get(BLACKHOLE_SERIES)
+        blackhole_interface = self.get_blackhole_interface()
+        stats = {}
+        for interface in requested:
+            if interface not in self.interfaces:
+                stats[interface] = {"error": f"Interface {interface} not found"}
+            elif interface in samples:
+                stats[interface] = self.format_stats(interface, samples[interface],
+                                                     blackhole if interface == blackhole_interface else None)
             else:
-                sent_bytes = last_io['bytes_sent']
-                recv_bytes = last_io['bytes_recv']
-            
-            return {
-                "interface": interface,
-                "total_sent": round(sent_bytes / 1024 / 1024, 2),
-                "total_recv": round(recv_bytes / 1024 / 1024, 2),
-                "sent_rate": round(sent_rate, 2),
-                "recv_rate": round(recv_rate, 2)
-            }
-        except Exception as e:
-            return {
-                "interface": interface,
-                "total_sent": 0,
-                "total_recv": 0,
-                "sent_rate": 0,
-                "recv_rate": 0
+                stats[interface] = {"error": f"Interface {interface} has no samples yet"}
+        return {
+            "timestamp": timestamp,
+            "interfaces": stats,
+            "blackhole": {
+                "interface": blackhole_interface,
+                "total_recv": round(blackhole['bytes_recv'] / 1024 / 1024, 2) if blackhole else 0,
+                "recv_rate": round(blackhole['recv_rate'] / 1024, 2) if blackhole else 0
             }
+        }
     
-    def get_mock_stats_with_downonly(self, interface):
-        """获取考虑流量黑洞的模拟统计数据"""
-        try:
-            # 生成模拟数据
-            sent_rate = random.uniform(0, 100)
-            
-            # 检查流量黑洞是否正在运行
-            try:
-                from services.downonly_service import get_status as downonly_status
-                downonly_info = downonly_status()
-                if downonly_info.get('is_running'):
-                    # 流量黑洞运行时，大幅增加接收速率
-                    recv_rate = random.uniform(100, 500)  # 100-500 KB/s
-                else:
-                    recv_rate = random.uniform(0, 150)  # 正常范围
-            except:
-                recv_rate = random.uniform(0, 150)
-            
-            # 生成累计数据
-            current_time = time.time()
-            if interface not in self.last_stats:
-                self.last_stats[interface] = {
-                    'bytes_sent': random.randint(1000000, 10000000),
-                    'bytes_recv': random.randint(2000000, 20000000),
-                    'time': current_time
-                }
-            
-            last_io = self.last_stats[interface]
-            time_diff = current_time - last_io['time']
-            
-            if time_diff > 0:
-                sent_bytes = last_io['bytes_sent'] + sent_rate * 1024 * time_diff
-                recv_bytes = last_io['bytes_recv'] + recv_rate * 1024 * time_diff
+    def get_usage(self, interfaces=None):
+        """计费统计 - 日/月收发总量（字节）与当月5分钟平均速率的p95/p99（字节/秒）
+        
+        interfaces: 需要的网卡列表，None表示所有监测的网卡；blackhole 为流量黑洞自身下载量的同口径统计
+        """
+        requested = list(self.interfaces) if not interfaces else interfaces
+        usage = {}
+        for interface in requested:
+            if interface not in self.interfaces:
+                usage[interface] = {"error": f"Interface {interface} not found"}
             else:
-                sent_bytes = last_io['bytes_sent']
-                recv_bytes = last_io['bytes_recv']
-            
-            return {
-                "interface": interface,
-                "total_sent": round(sent_bytes / 1024 / 1024, 2),
-                "total_recv": round(recv_bytes / 1024 / 1024, 2),
-                "sent_rate": round(sent_rate, 2),
-                "recv_rate": round(recv_rate, 2)
-            }
-        except Exception as e:
-            return {
-                "interface": interface,
-                "total_sent": 0,
-                "total_recv": 0,
-                "sent_rate": 0,
-                "recv_rate": 0
-            }
+                usage[interface] = self.usage.get_usage(interface) or {"error": f"Interface {interface} has no samples yet"}
+        return {
+            "bucket_seconds": self.usage.bucket_seconds,
+            "interfaces": usage,
+            "blackhole": self.usage.get_usage(BLACKHOLE_SERIES)
+        }
     
-    def get_history(self, interface):
-        """获取网卡历史数据"""
+    def shutdown(self):
+        """进程退出前调用：停止采样和网卡发现，保存计费统计和流量历史"""
+        self.sampler.stop()
+        self.discovery.stop()
+        self.usage.save()
+        self.history.flush()
+    
+    @staticmethod
+    def parse_range(value, default=120):
+        """解析时间范围：秒数，或带单位 s/m/h/d，如 600、10m、24h、90d"""
+        if value in (None, ""):
+            return default
+        units = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+        value = str(value).strip().lower()
+        if value[-1] in units:
+            seconds = float(value[:-1]) * units[value[-1]]
+        else:
+            seconds = float(value)
+        if seconds <= 0:
+            raise ValueError(f"无效的时间范围: {value}")
+        return seconds
+    
+    def get_history(self, interface, range_value=None, resolution=None):
+        """获取网卡历史数据 - 来自秒/分钟/小时三级流量历史
+        
+        range_value: 时间范围（默认最近2分钟），resolution: 1s / 1m / 1h / auto（默认按范围自动选择）
+        承载流量黑洞下载的网卡额外返回 blackhole_recv 和 foreground_recv 序列
+        """
         try:
-            # 生成模拟的历史数据
-            timestamps = []
-            sent_data = []
-            recv_data = []
-            
-            current_time = datetime.now()
-            
-            # 生成最近60个时间点的数据
-            for i in range(60):
-                time_point = current_time - timedelta(seconds=i*2)
-                timestamp = time_point.strftime("%H:%M:%S")
-                
-                # 生成模拟数据（KB/s）
-                sent_rate = random.uniform(5, 50)
-                recv_rate = random.uniform(10, 80)
-                
-                timestamps.insert(0, timestamp)
-                sent_data.insert(0, round(sent_rate, 2))
-                recv_data.insert(0, round(recv_rate, 2))
-            
-            return {
-                "timestamp": timestamps,
-                "sent": sent_data,
-                "recv": recv_data
-            }
-            
+            if interface not in self.interfaces:
+                return {"error": f"Interface {interface} not found"}
+            range_seconds = self.parse_range(range_value)
+            generated = BLACKHOLE_SERIES if interface == self.get_blackhole_interface() else None
+            return self.history.query(interface, range_seconds, resolution, time.time(), generated)
         except Exception as e:
             return {"error": str(e)}
 
+    def get_history_version(self, interface, range_value=None, resolution=None):
+        """get_history() 结果的版本标识，参数无效时返回None（由get_history返回错误）"""
+        try:
+            if interface not in self.interfaces:
+                return None
+            range_seconds = self.parse_range(range_value)
+            generated = BLACKHOLE_SERIES if interface == self.get_blackhole_interface() else None
+            return self.history.version(interface, range_seconds, resolution, time.time(), generated)
+        except Exception:
+            return None
+
 # 全局实例
 monitor_service = MonitorService()
 
@@ -308,20 +279,30 @@ def get_interfaces():
 def get_stats(interface):
     return monitor_service.get_stats(interface)
 
-def get_history(interface):
-    return monitor_service.get_history(interface)
+def get_all_stats(interfaces=None):
+    return monitor_service.get_all_stats(interfaces)
+
+def get_history(interface, range_value=None, resolution=None):
+    return monitor_service.get_history(interface, range_value, resolution)
+
+def get_interfaces_version():
+    return monitor_service.get_interfaces_version()
+
+def get_history_version(interface, range_value=None, resolution=None):
+    return monitor_service.get_history_version(interface, range_value, resolution)
+
+def get_usage(interfaces=None):
+    return monitor_service.get_usage(interfaces)
 
 # 启动后台更新线程
 def start_background_update():
-    """启动后台更新线程"""
-    def update_loop():
-        while monitor_service.running:
-            # 每隔一段时间刷新网卡列表
-            time.sleep(30)
-            monitor_service.refresh_interfaces()
-    
-    thread = threading.Thread(target=update_loop, daemon=True)
-    thread.start()
+    """启动网卡发现和采样线程"""
+    from services.event_stream import live_publisher
+    monitor_service.discovery.start()
+    # 每个采样节拍向SSE订阅者推送一次
+    monitor_service.sampler.add_listener(live_publisher.on_tick)
+    monitor_service.sampler.add_listener(monitor_service.usage.on_tick)
+    monitor_service.sampler.start()
 
 # 启动后台更新
 start_background_update()
\ No newline at end of file
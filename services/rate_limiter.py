@@ -0,0 +1,73 @@
+"""限速服务 - 全局令牌桶"""
+
+import threading
+import time
+import logging
+
+
+class RateLimiter:
+    """令牌桶限速器 - 所有下载流共享同一个桶"""
+
+    def __init__(self, rate_mbps=0, burst_seconds=0.25):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.burst_seconds = burst_seconds  # 桶容量 = 速率 × 该时长，决定亚秒级平滑程度
+        self.rate_bytes = 0.0  # 每秒补充的字节数，0 表示不限速
+        self.capacity = 0.0
+        self.tokens = 0.0
+        self.last_refill = time.monotonic()
+        self.set_rate(rate_mbps)
+
+    def set_rate(self, rate_mbps, log=True):
+        """设置限速 (Mbps)，运行中即时生效；频繁调整（如匀速下载）时可关闭日志"""
+        rate_mbps = max(0.0, float(rate_mbps or 0))
+        with self.lock:
+            self.refill()
+            self.rate_bytes = rate_mbps * 1000 * 1000 / 8
+            self.capacity = self.rate_bytes * self.burst_seconds
+            # 降速时立即收回多余令牌，避免旧速率的突发
+            self.tokens = min(self.tokens, self.capacity)
+        if log:
+            self.logger.info(f"下载限速已设置为: {rate_mbps} Mbps" if rate_mbps > 0 else "下载限速已关闭")
+
+    def get_rate_mbps(self):
+        """获取当前限速 (Mbps)"""
+        return self.rate_bytes * 8 / 1000 / 1000
+
+    def refill(self):
+        """按流逝时间补充令牌（需持有锁）"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate_bytes)
+        self.last_refill = now
+
+    def chunk_size(self, default=1024 * 1024):
+        """建议的单次读取大小：约为每秒配额的1/20，让读取节奏足够平滑"""
+        if self.rate_bytes <= 0:
+            return default
+        return int(min(default, max(16 * 1024, self.rate_bytes / 20)))
+
+    def reserve(self, nbytes):
+        """预扣令牌，返回需要等待的秒数（不阻塞，供asyncio引擎使用）"""
+        with self.lock:
+            if self.rate_bytes <= 0:
+                return 0.0
+            self.refill()
+            self.tokens -= nbytes
+            return -self.tokens / self.rate_bytes if self.tokens < 0 else 0.0
+
+    def consume(self, nbytes):
+        """消耗令牌，令牌不足时阻塞到欠额还清"""
+        wait = self.reserve(nbytes)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+# 全局实例
+rate_limiter = RateLimiter()
+
+def set_rate(rate_mbps):
+    return rate_limiter.set_rate(rate_mbps)
+
+def get_rate_mbps():
+    return rate_limiter.get_rate_mbps()
@@ -0,0 +1,311 @@
+"""下载调度器 - 运行时段、随机休息与每日随机配额"""
+
+import os
+import json
+import random
+import threading
+import logging
+from datetime import datetime, date, timedelta
+
+
+GB = 1024 * 1024 * 1024
+
+
+class DownloadScheduler:
+    """下载调度器 - 定时驱动的状态机
+
+    状态（与前端状态名一致）:
+        running          运行时段内，正在下载
+        sleeping         两轮下载之间的随机休息
+        out_of_schedule  不在运行时段内，等待开始时间
+        quota_reached    今日配额已用完，等待次日
+        stopped          服务未启动
+    """
+
+    PACING_INTERVAL = 10  # 匀速模式下重新计算速率的间隔（秒）
+    PACING_MIN_SECONDS = 60  # 剩余时间不足时按该值计算，避免时段末尾速率飙升
+
+    def __init__(self, service):
+        self.logger = logging.getLogger(__name__)
+        self.service = service
+        self.lock = threading.Lock()
+        self.wake_event = threading.Event()  # 配置变化、配额用尽或停止时提前唤醒
+        self.download_gate = threading.Event()  # 置位时下载流才允许读取数据
+        self.state = "stopped"
+        self.state_since = datetime.now()
+        self.next_transition = None
+        self.burst_until = None
+        self.sleep_until = None
+
+        # 调度参数（从配置加载）
+        self.schedule_start = "00:00"
+        self.schedule_end = "23:59"
+        self.sleep_min_minutes = 10
+        self.sleep_max_minutes = 20
+        self.burst_min_minutes = 20
+        self.burst_max_minutes = 40
+        self.quota_min_gb = 100
+        self.quota_max_gb = 200
+        self.pacing = False
+
+        self.quota_date = None
+        self.state_file = None
+
+    def read_number(self, config, key, current, minimum=0.0):
+        """读取数值参数，不小于minimum；缺失或无效时保留当前值"""
+        value = config.get(key, current)
+        try:
+            return max(minimum, float(value))
+        except (TypeError, ValueError) as e:
+            self.logger.info(f"无效的配置 {key}={value!r}，保留当前值 {current}: {e}")
+            return current
+
+    def read_time(self, config, key, current):
+        """读取 HH:MM 时刻；无效时保留当前值"""
+        value = config.get(key, current)
+        try:
+            hour, minute = str(value).split(':')[:2]
+            if 0 <= int(hour) < 24 and 0 <= int(minute) < 60:
+                return value
+        except (TypeError, ValueError):
+            pass
+        self.logger.info(f"无效的配置 {key}={value!r}，保留当前值 {current}")
+        return current
+
+    def load_config(self, config):
+        """从配置加载调度参数，运行中修改即时生效；无效或为负的值保留当前值/截断为0"""
+        # 先全部校验再一起赋值，不会出现只更新了一部分参数的状态
+        schedule_start = self.read_time(config, 'schedule_start', self.schedule_start)
+        schedule_end = self.read_time(config, 'schedule_end', self.schedule_end)
+        sleep_min = self.read_number(config, 'sleep_min_minutes', self.sleep_min_minutes)
+        sleep_max = max(sleep_min, self.read_number(config, 'sleep_max_minutes', self.sleep_max_minutes))
+        # 下载时长为0时调度器会不停切换状态，至少1分钟
+        burst_min = self.read_number(config, 'burst_min_minutes', self.burst_min_minutes, minimum=1.0)
+        burst_max = max(burst_min, self.read_number(config, 'burst_max_minutes', self.burst_max_minutes, minimum=1.0))
+        quota_min = self.read_number(config, 'daily_quota_min_gb', self.quota_min_gb)
+        quota_max = max(quota_min, self.read_number(config, 'daily_quota_max_gb', self.quota_max_gb))
+
+        self.schedule_start, self.schedule_end = schedule_start, schedule_end
+        self.sleep_min_minutes, self.sleep_max_minutes = sleep_min, sleep_max
+        self.burst_min_minutes, self.burst_max_minutes = burst_min, burst_max
+        self.quota_min_gb, self.quota_max_gb = quota_min, quota_max
+        self.pacing = bool(config.get('pacing', self.pacing))
+        if not self.pacing and self.service.paced_rate_mbps is not None:
+            self.service.update_paced_rate(None)
+
+        with self.lock:
+            if self.quota_date is not None:
+                # 今日配额不在新的范围内时重新抽取
+                quota_gb = self.service.daily_quota_bytes / GB
+                if not self.quota_min_gb <= quota_gb <= self.quota_max_gb:
+                    self.draw_daily_quota(self.quota_date)
+        self.wake_event.set()
+
+    # ===== 每日配额 =====
+
+    def get_state_file(self):
+        if self.state_file is None:
+            from services.config_service import get_data_dir
+            self.state_file = os.path.join(get_data_dir(), 'scheduler_state.json')
+        return self.state_file
+
+    def draw_daily_quota(self, day):
+        """在[最小, 最大]配额之间随机抽取当天配额并持久化（需持有锁）"""
+        quota_gb = random.uniform(self.quota_min_gb, self.quota_max_gb)
+        self.service.daily_quota_bytes = int(quota_gb * GB)
+        self.quota_date = day
+        try:
+            state_file = self.get_state_file()
+            temp_file = state_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump({"date": day.isoformat(), "quota_bytes": self.service.daily_quota_bytes}, f)
+            os.replace(temp_file, state_file)
+        except Exception as e:
+            self.logger.info(f"保存今日配额失败: {e}")
+        self.logger.info(f"{day} 的每日配额: {quota_gb:.2f} GB")
+
+    def ensure_daily_quota(self, day):
+        """确保当天已有配额：重启后沿用已抽取的配额，跨天或配额范围已修改时重新抽取（需持有锁）"""
+        if self.quota_date == day:
+            return
+        try:
+            with open(self.get_state_file(), 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            quota_gb = int(saved['quota_bytes']) / GB
+            if saved.get('date') == day.isoformat() and self.quota_min_gb <= quota_gb <= self.quota_max_gb:
+                self.service.daily_quota_bytes = int(saved['quota_bytes'])
+                self.quota_date = day
+                self.logger.info(f"恢复今日配额: {self.service.daily_quota_bytes / GB:.2f} GB")
+                return
+        except Exception:
+            pass
+        self.draw_daily_quota(day)
+
+    def set_daily_quota(self, quota_gb):
+        """手动指定今日配额"""
+        with self.lock:
+            self.service.daily_quota_bytes = int(quota_gb * GB)
+            self.quota_date = date.today()
+        self.wake_event.set()
+
+    # ===== 运行时段 =====
+
+    @staticmethod
+    def parse_time(value):
+        hour, minute = str(value).split(':')[:2]
+        return int(hour) * 60 + int(minute)
+
+    def in_window(self, now):
+        """是否在运行时段内（支持跨午夜，如 22:00-06:00）"""
+        try:
+            start = self.parse_time(self.schedule_start)
+            end = self.parse_time(self.schedule_end)
+        except (ValueError, TypeError):
+            return True
+        minute = now.hour * 60 + now.minute
+        if start <= end:
+            return start <= minute <= end
+        return minute >= start or minute <= end
+
+    def window_end(self, now):
+        """当前运行时段的结束时刻"""
+        end = self.parse_time(self.schedule_end)
+        end_time = now.replace(hour=end // 60, minute=end % 60, second=59, microsecond=0)
+        if end_time < now:
+            end_time += timedelta(days=1)
+        return end_time
+
+    def window_start(self, now):
+        """下一个运行时段的开始时刻"""
+        start = self.parse_time(self.schedule_start)
+        start_time = now.replace(hour=start // 60, minute=start % 60, second=0, microsecond=0)
+        if start_time <= now:
+            start_time += timedelta(days=1)
+        return start_time
+
+    @staticmethod
+    def next_midnight(now):
+        return datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+
+    # ===== 匀速下载 =====
+
+    def update_pacing(self, now):
+        """按剩余配额 / 剩余有效下载时间计算目标速率并下发给限速器（需持有锁）
+
+        有效下载时间 = 距运行时段结束（不超过午夜）的时间 × 下载时间占比，
+        占比由平均下载时长和平均休息时长估算。每次评估都用账本中的实际累计重新计算，
+        失败、暂停造成的落后会自动摊到剩余时间里追回。
+        """
+        if not self.pacing:
+            return
+        remaining_bytes = max(0, self.service.daily_quota_bytes - self.service.today_total_bytes)
+        end = min(self.window_end(now), self.next_midnight(now))
+        burst = (self.burst_min_minutes + self.burst_max_minutes) / 2
+        sleep = (self.sleep_min_minutes + self.sleep_max_minutes) / 2
+        active_ratio = burst / (burst + sleep) if burst + sleep > 0 else 1.0
+        active_seconds = max(self.PACING_MIN_SECONDS, (end - now).total_seconds() * active_ratio)
+        paced_rate_mbps = max(0.01, remaining_bytes * 8 / active_seconds / 1000 / 1000)
+        self.service.update_paced_rate(paced_rate_mbps)
+
+    # ===== 状态机 =====
+
+    def set_state(self, state, next_transition):
+        """切换状态并开关下载闸门（需持有锁）"""
+        if state != self.state:
+            self.logger.info(f"调度状态: {self.state} -> {state}"
+                             + (f"，下次切换 {next_transition:%H:%M:%S}" if next_transition else ""))
+            self.state = state
+            self.state_since = datetime.now()
+        self.next_transition = next_transition
+        if state == "running":
+            self.download_gate.set()
+        else:
+            self.download_gate.clear()
+
+    def evaluate(self, now):
+        """根据当前时间、配额和休息计划计算状态，返回下次需要检查的时刻（需持有锁）"""
+        self.ensure_daily_quota(now.date())
+        self.service.refresh_today_bytes()  # 跨天时今日累计归零
+        midnight = self.next_midnight(now)
+
+        if self.service.today_total_bytes >= self.service.daily_quota_bytes:
+            self.set_state("quota_reached", midnight)
+            return midnight
+
+        if not self.in_window(now):
+            self.burst_until = None
+            start = self.window_start(now)
+            self.set_state("out_of_schedule", start)
+            return min(start, midnight)
+
+        if self.state == "sleeping" and self.sleep_until and now < self.sleep_until:
+            self.set_state("sleeping", self.sleep_until)
+            return min(self.sleep_until, midnight)
+
+        if self.state == "running" and self.burst_until and now >= self.burst_until:
+            self.sleep_until = now + timedelta(minutes=random.uniform(self.sleep_min_minutes, self.sleep_max_minutes))
+            self.burst_until = None
+            self.set_state("sleeping", self.sleep_until)
+            return min(self.sleep_until, midnight)
+
+        if self.state != "running" or self.burst_until is None:
+            self.burst_until = now + timedelta(minutes=random.uniform(self.burst_min_minutes, self.burst_max_minutes))
+        next_check = min(self.burst_until, self.window_end(now), midnight)
+        self.set_state("running", next_check)
+        self.update_pacing(now)
+        if self.pacing:
+            return min(next_check, now + timedelta(seconds=self.PACING_INTERVAL))
+        return next_check
+
+    def run(self, generation):
+        """调度线程 - 在状态切换时刻（或被唤醒时）重新评估"""
+        self.logger.info("下载调度器启动")
+        while self.service.is_active(generation):
+            try:
+                now = datetime.now()
+                with self.lock:
+                    next_check = self.evaluate(now)
+                timeout = max(0.05, (next_check - datetime.now()).total_seconds())
+                self.wake_event.wait(timeout=min(timeout, 60))
+                self.wake_event.clear()
+            except Exception as e:
+                self.logger.info(f"调度器错误: {e}")
+                self.wake_event.wait(timeout=5)
+                self.wake_event.clear()
+        with self.lock:
+            # 服务已重新启动时，新的调度线程接管闸门，这里不能再关闸
+            if generation == self.service.generation:
+                self.set_state("stopped", None)
+        self.logger.info("下载调度器已停止")
+
+    def start(self, generation):
+        with self.lock:
+            self.state = "stopped"
+            self.burst_until = None
+            self.sleep_until = None
+            self.ensure_daily_quota(date.today())
+        self.wake_event.clear()
+        threading.Thread(target=self.run, args=(generation,), daemon=True).start()
+
+    def stop(self):
+        self.download_gate.clear()
+        self.wake_event.set()
+        # 停止后不再按匀速目标限速，状态和限速器恢复为用户设置的限速
+        self.service.update_paced_rate(None)
+
+    def on_quota_reached(self):
+        """配额在字节边界用尽时由下载流调用，立即关闭闸门"""
+        self.download_gate.clear()
+        self.wake_event.set()
+
+    def get_info(self):
+        with self.lock:
+            return {
+                "status": self.state,
+                "state_since": self.state_since.strftime("%Y-%m-%d %H:%M:%S"),
+                "next_transition": self.next_transition.strftime("%Y-%m-%d %H:%M:%S") if self.next_transition else None,
+                "schedule_start": self.schedule_start,
+                "schedule_end": self.schedule_end,
+                "pacing": self.pacing,
+                "paced_rate_mbps": round(self.service.paced_rate_mbps, 2) if self.service.paced_rate_mbps is not None else None
+            }
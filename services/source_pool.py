@@ -0,0 +1,159 @@
+"""下载源池 - 按吞吐量加权选择下载源，并对故障源熔断"""
+
+import threading
+import time
+import random
+import logging
+
+
+class SourceStats:
+    """单个下载源的健康统计"""
+
+    def __init__(self, url):
+        self.url = url
+        self.ewma_mbps = None  # 吞吐量指数滑动平均
+        self.ewma_ttfb_ms = None  # 首字节时间指数滑动平均
+        self.failure_rate = 0.0  # 失败率指数滑动平均 (0~1)
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.total_bytes = 0
+        self.last_error = None
+        self.last_error_time = None
+        self.last_success_time = None
+        self.open_until = 0.0  # 熔断截止时间 (monotonic)
+        self.probing = False  # 半开状态下是否已有探测请求
+
+    def state(self, now):
+        if self.consecutive_failures == 0 or self.open_until == 0.0:
+            return "closed"
+        return "open" if now < self.open_until else "half_open"
+
+
+class SourcePool:
+    """下载源池 - EWMA吞吐量加权选择 + 熔断 + 指数退避"""
+
+    def __init__(self, alpha=0.3, failure_threshold=3, base_backoff=5.0, max_backoff=600.0):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold  # 连续失败多少次后熔断
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.sources = {}
+
+    def sync(self, urls):
+        """与配置中的URL列表同步，保留已有URL的统计"""
+        with self.lock:
+            self.sources = {url: self.sources.get(url) or SourceStats(url) for url in urls}
+
+    def score(self, stats):
+        """评分 = 吞吐量 × (1 - 失败率)²；未测量的源按当前最佳吞吐量计分以便探索"""
+        known = [s.ewma_mbps for s in self.sources.values() if s.ewma_mbps]
+        prior = max(known) if known else 100.0
+        throughput = stats.ewma_mbps if stats.ewma_mbps else prior
+        return max(throughput, 0.01) * (1.0 - stats.failure_rate) ** 2
+
+    def select(self, weighted=True):
+        """选择一个下载源：weighted=True 按评分加权随机，False 总是选评分最高的"""
+        now = time.monotonic()
+        with self.lock:
+            candidates = []
+            for stats in self.sources.values():
+                state = stats.state(now)
+                if state == "open":
+                    continue
+                if state == "half_open":
+                    # 熔断到期后只放行一个探测请求
+                    if stats.probing:
+                        continue
+                candidates.append(stats)
+            if not candidates:
+                return None
+
+            if weighted:
+                weights = [self.score(stats) for stats in candidates]
+                chosen = random.choices(candidates, weights=weights, k=1)[0]
+            else:
+                chosen = max(candidates, key=self.score)
+
+            if chosen.state(now) == "half_open":
+                chosen.probing = True
+            return chosen.url
+
+    def next_retry_in(self):
+        """所有源均熔断时，距离最早恢复探测的秒数"""
+        now = time.monotonic()
+        with self.lock:
+            waits = [stats.open_until - now for stats in self.sources.values() if stats.open_until > now]
+        return max(1.0, min(waits)) if waits else 1.0
+
+    def ewma(self, old, value):
+        return value if old is None else old + self.alpha * (value - old)
+
+    def record_ttfb(self, url, ttfb_seconds):
+        """记录首字节时间"""
+        with self.lock:
+            stats = self.sources.get(url)
+            if stats:
+                stats.ewma_ttfb_ms = self.ewma(stats.ewma_ttfb_ms, ttfb_seconds * 1000)
+
+    def record_success(self, url, nbytes, duration):
+        """记录一次成功的下载"""
+        with self.lock:
+            stats = self.sources.get(url)
+            if not stats:
+                return
+            if duration > 0 and nbytes > 0:
+                stats.ewma_mbps = self.ewma(stats.ewma_mbps, nbytes * 8 / duration / 1000 / 1000)
+            stats.failure_rate = self.ewma(stats.failure_rate, 0.0)
+            stats.successes += 1
+            stats.total_bytes += nbytes
+            stats.consecutive_failures = 0
+            stats.open_until = 0.0
+            stats.probing = False
+            stats.last_success_time = time.time()
+
+    def record_failure(self, url, error, nbytes=0):
+        """记录一次失败，连续失败达到阈值后按指数退避熔断"""
+        with self.lock:
+            stats = self.sources.get(url)
+            if not stats:
+                return
+            stats.failure_rate = self.ewma(stats.failure_rate, 1.0)
+            stats.failures += 1
+            stats.total_bytes += nbytes
+            stats.consecutive_failures += 1
+            stats.probing = False
+            stats.last_error = str(error)
+            stats.last_error_time = time.time()
+            if stats.consecutive_failures >= self.failure_threshold:
+                exponent = stats.consecutive_failures - self.failure_threshold
+                backoff = min(self.max_backoff, self.base_backoff * (2 ** exponent))
+                stats.open_until = time.monotonic() + backoff
+                self.logger.info(f"下载源熔断 {backoff:.0f} 秒: {url} (连续失败 {stats.consecutive_failures} 次)")
+
+    def get_scoreboard(self):
+        """获取所有下载源的健康统计"""
+        now = time.monotonic()
+        with self.lock:
+            board = []
+            for stats in self.sources.values():
+                board.append({
+                    "url": stats.url,
+                    "state": stats.state(now),
+                    "score": round(self.score(stats), 3),
+                    "ewma_mbps": round(stats.ewma_mbps, 2) if stats.ewma_mbps is not None else None,
+                    "ttfb_ms": round(stats.ewma_ttfb_ms, 1) if stats.ewma_ttfb_ms is not None else None,
+                    "failure_rate": round(stats.failure_rate, 3),
+                    "successes": stats.successes,
+                    "failures": stats.failures,
+                    "consecutive_failures": stats.consecutive_failures,
+                    "total_bytes": stats.total_bytes,
+                    "retry_in_seconds": round(max(0.0, stats.open_until - now), 1),
+                    "last_error": stats.last_error,
+                    "last_error_time": stats.last_error_time,
+                    "last_success_time": stats.last_success_time
+                })
+            board.sort(key=lambda item: item["score"], reverse=True)
+            return board
@@ -0,0 +1,301 @@
+"""网卡流量历史 - 多分辨率分层时间序列（秒 / 分钟 / 小时），分钟和小时层持久化到内存映射文件"""
+
+import os
+import re
+import math
+import mmap
+import atexit
+import threading
+import logging
+from array import array
+from datetime import datetime
+
+
+# 历史文件格式：第一页为文件头，之后依次是各持久化层的定长记录区
+FILE_MAGIC = b"SNTHIST1"
+HEADER_SIZE = mmap.PAGESIZE
+META_OFFSET = 64  # 每层元数据（8个double）在文件头中的起始位置
+META_FIELDS = 8  # head, count, 当前桶开始, 当前桶接收, 当前桶发送, 当前桶最后样本时间, 分辨率, 容量
+RECORD_FIELDS = 3  # 每条记录: 桶开始时间, 接收字节, 发送字节
+
+
+class Tier:
+    """单一分辨率的时间序列层 - 预分配定长环形缓冲区
+
+    每个槽位保存一个时间桶内的接收/发送字节数；当前未结束的桶在内存中累加，
+    跨桶时写入环形缓冲区并把该桶转交给下一层（增量汇总，不回读原始样本）。
+    records/meta 可以是内存中的array，也可以是映射到文件的memoryview，写入方式相同。
+    """
+
+    def __init__(self, name, resolution, capacity, input_resolution=1, records=None, meta=None):
+        self.name = name
+        self.resolution = resolution  # 桶宽度（秒）
+        self.capacity = capacity
+        self.input_resolution = input_resolution  # 输入样本（上一层的桶）的宽度
+        self.records = records if records is not None else array('d', [0.0]) * (capacity * RECORD_FIELDS)
+        self.meta = meta  # 持久化层的元数据区，None表示纯内存
+        # 输入每分钟最多一次的层，未结束的桶也写入元数据，重启后不丢失
+        self.persist_open = input_resolution >= 60
+        self.next_tier = None
+        self.head = -1
+        self.count = 0
+        self.current_start = None
+        self.current_recv = 0.0
+        self.current_sent = 0.0
+        self.current_last = None  # 当前桶最后一个样本的时间
+        if meta is not None:
+            self.restore_meta()
+
+    def restore_meta(self):
+        """从映射文件恢复环形缓冲区位置和未结束的桶，不解析记录"""
+        meta = self.meta
+        self.head = int(meta[0])
+        self.count = int(meta[1])
+        if self.persist_open and meta[2] >= 0:
+            self.current_start = meta[2]
+            self.current_recv = meta[3]
+            self.current_sent = meta[4]
+            self.current_last = meta[5]
+
+    def write_meta(self):
+        meta = self.meta
+        meta[0] = self.head
+        meta[1] = self.count
+        if self.persist_open:
+            meta[2] = self.current_start if self.current_start is not None else -1.0
+            meta[3] = self.current_recv
+            meta[4] = self.current_sent
+            meta[5] = self.current_last if self.current_last is not None else -1.0
+
+    def add(self, timestamp, recv_bytes, sent_bytes):
+        """累加到当前桶，进入新的桶时先提交上一个"""
+        bucket = timestamp - timestamp % self.resolution
+        if self.current_start is not None and bucket != self.current_start:
+            self.commit()
+        if self.current_start is None:
+            self.current_start = bucket
+        self.current_recv += recv_bytes
+        self.current_sent += sent_bytes
+        self.current_last = timestamp
+        if self.meta is not None and self.persist_open:
+            self.write_meta()
+
+    def commit(self):
+        """把当前桶写入环形缓冲区，并汇总到下一层"""
+        head = (self.head + 1) % self.capacity
+        offset = head * RECORD_FIELDS
+        self.records[offset] = self.current_start
+        self.records[offset + 1] = self.current_recv
+        self.records[offset + 2] = self.current_sent
+        # 先写记录再更新位置，崩溃时最多丢失这一条
+        self.head = head
+        self.count = min(self.count + 1, self.capacity)
+        if self.next_tier is not None:
+            self.next_tier.add(self.current_start, self.current_recv, self.current_sent)
+        self.current_start = None
+        self.current_recv = 0.0
+        self.current_sent = 0.0
+        if self.meta is not None:
+            self.write_meta()
+
+    def last_closed(self):
+        """最近一个已结束的桶的开始时间，没有时返回None"""
+        return self.records[self.head * RECORD_FIELDS] if self.count else None
+
+    def query(self, since):
+        """返回开始时间不早于since的已结束的桶 [(开始时间, 接收字节/秒, 发送字节/秒)]
+
+        当前未结束的桶每个采样节拍都在变化，不包含在结果中，由前端的实时统计补上。
+        """
+        points = []
+        records = self.records
+        for k in range(self.count):
+            offset = ((self.head - self.count + 1 + k) % self.capacity) * RECORD_FIELDS
+            if records[offset] >= since:
+                points.append((records[offset], records[offset + 1] / self.resolution,
+                               records[offset + 2] / self.resolution))
+        return points
+
+
+class HistoryFile:
+    """单个网卡的内存映射历史文件 - 定长记录，原地写入，无序列化
+
+    文件头: 魔数 + 每层元数据；记录区: 每层 容量 × (开始时间, 接收, 发送) 个double。
+    层定义（分辨率、容量）与文件不一致或文件损坏时重新创建。
+    """
+
+    def __init__(self, path, tiers):
+        self.path = path
+        self.tiers = tiers  # [(名称, 分辨率, 容量)]
+        self.size = HEADER_SIZE + sum(capacity * RECORD_FIELDS * 8 for _, _, capacity in tiers)
+        self.file = None
+        self.mm = None
+
+    def open(self):
+        """打开或创建文件，返回 ({层名称: (记录区, 元数据区)}, 是否恢复了已有历史)"""
+        fresh = not os.path.exists(self.path) or os.path.getsize(self.path) != self.size
+        self.file = open(self.path, 'w+b' if fresh else 'r+b')
+        if fresh:
+            self.file.truncate(self.size)
+        self.mm = mmap.mmap(self.file.fileno(), self.size)
+        view = memoryview(self.mm)
+
+        metas = []
+        records = []
+        offset = HEADER_SIZE
+        for index, (_, resolution, capacity) in enumerate(self.tiers):
+            meta_offset = META_OFFSET + index * META_FIELDS * 8
+            metas.append(view[meta_offset:meta_offset + META_FIELDS * 8].cast('d'))
+            length = capacity * RECORD_FIELDS * 8
+            records.append(view[offset:offset + length].cast('d'))
+            offset += length
+
+        valid = not fresh and self.mm[:len(FILE_MAGIC)] == FILE_MAGIC and all(
+            meta[6] == resolution and meta[7] == capacity and 0 <= meta[1] <= capacity and -1 <= meta[0] < capacity
+            for meta, (_, resolution, capacity) in zip(metas, self.tiers))
+        if not valid:
+            # 新文件或格式不符：清零并写入文件头
+            self.mm[:] = bytes(self.size)
+            for meta, (_, resolution, capacity) in zip(metas, self.tiers):
+                meta[0] = -1
+                meta[2] = -1
+                meta[6] = resolution
+                meta[7] = capacity
+            self.mm[:len(FILE_MAGIC)] = FILE_MAGIC
+        return {name: (record, meta) for (name, _, _), record, meta in zip(self.tiers, records, metas)}, valid
+
+    def flush(self):
+        if self.mm is not None:
+            self.mm.flush()
+
+
+class TrafficHistory:
+    """网卡流量历史 - 每个网卡一组分层时间序列，内存和磁盘占用与运行时长无关
+
+    秒级保留10分钟（仅内存），分钟级保留24小时，小时级保留90天（持久化）。
+    秒层提交的桶汇总到分钟层，分钟层汇总到小时层；持久化层每分钟只更新一两个页，
+    写入由内核按页回写，不会频繁唤醒NAS硬盘。
+    """
+
+    TIERS = (
+        ("1s", 1, 600),
+        ("1m", 60, 1440),
+        ("1h", 3600, 90 * 24),
+    )
+    PERSISTED_TIERS = ("1m", "1h")
+
+    def __init__(self, history_dir=None):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.history_dir = history_dir
+        self.series = {}  # {网卡: {分辨率名: Tier}}
+        self.files = {}  # {网卡: HistoryFile}
+        atexit.register(self.flush)
+
+    def get_history_dir(self):
+        if self.history_dir is None:
+            from services.config_service import get_data_dir
+            self.history_dir = os.path.join(get_data_dir(), 'monitor_history')
+        os.makedirs(self.history_dir, exist_ok=True)
+        return self.history_dir
+
+    def open_file(self, interface):
+        """打开网卡的历史文件，失败时返回空（退化为纯内存）"""
+        try:
+            name = re.sub(r'[^A-Za-z0-9_.@-]', '_', interface)
+            persisted = [tier for tier in self.TIERS if tier[0] in self.PERSISTED_TIERS]
+            history_file = HistoryFile(os.path.join(self.get_history_dir(), f"{name}.hist"), persisted)
+            storage, restored = history_file.open()
+            self.files[interface] = history_file
+            if restored:
+                self.logger.info(f"已恢复网卡 {interface} 的流量历史")
+            return storage
+        except Exception as e:
+            self.logger.info(f"打开网卡 {interface} 的历史文件失败，仅保存在内存中: {e}")
+            return {}
+
+    def create_tiers(self, interface):
+        """为网卡分配各分辨率层并串联汇总关系（需持有锁）"""
+        storage = self.open_file(interface)
+        tiers = {}
+        previous = None
+        for name, resolution, capacity in self.TIERS:
+            records, meta = storage.get(name, (None, None))
+            input_resolution = previous.resolution if previous is not None else 1
+            tier = Tier(name, resolution, capacity, input_resolution, records, meta)
+            if previous is not None:
+                previous.next_tier = tier
+            tiers[name] = previous = tier
+        self.series[interface] = tiers
+        return tiers
+
+    def get_tiers(self, interface):
+        """网卡的各分辨率层，首次访问时打开历史文件（需持有锁）"""
+        tiers = self.series.get(interface)
+        return tiers if tiers is not None else self.create_tiers(interface)
+
+    def add(self, interface, timestamp, recv_bytes, sent_bytes):
+        """记录一次采样间隔内的增量字节数，写入秒层后逐层汇总"""
+        timestamp = int(timestamp)
+        with self.lock:
+            self.get_tiers(interface)[self.TIERS[0][0]].add(timestamp, recv_bytes, sent_bytes)
+
+    def pick_resolution(self, range_seconds):
+        """自动选择能覆盖时间范围的最细分辨率"""
+        for name, resolution, capacity in self.TIERS:
+            if range_seconds <= resolution * capacity:
+                return name
+        return self.TIERS[-1][0]
+
+    def resolve_resolution(self, range_seconds, resolution):
+        if resolution in (None, "", "auto"):
+            resolution = self.pick_resolution(range_seconds)
+        if resolution not in [name for name, _, _ in self.TIERS]:
+            raise ValueError(f"不支持的分辨率: {resolution}")
+        return resolution
+
+    def version(self, interface, range_seconds, resolution, now, generated=None):
+        """query() 结果的版本标识 - 只有所查层结束一个桶或时间窗口滑过一个桶时才变化，不需要执行查询"""
+        resolution = self.resolve_resolution(range_seconds, resolution)
+        width = next(width for name, width, _ in self.TIERS if name == resolution)
+        # 查询包含开始时间 >= now - range_seconds 的桶，第一个桶的序号决定窗口内容
+        first_bucket = math.ceil((now - range_seconds) / width)
+        with self.lock:
+            last_closed = self.get_tiers(interface)[resolution].last_closed()
+            generated_closed = self.get_tiers(generated)[resolution].last_closed() if generated else None
+        return (interface, generated, resolution, first_bucket, last_closed, generated_closed)
+
+    def query(self, interface, range_seconds, resolution, now, generated=None):
+        """查询最近range_seconds秒的历史，速率单位KB/s，与实时统计一致
+
+        generated: 经由该网卡产生的流量序列名（如流量黑洞），指定时按时间桶对齐，
+        额外返回该序列的接收速率 blackhole_recv 和扣除后的 foreground_recv。
+        """
+        resolution = self.resolve_resolution(range_seconds, resolution)
+        with self.lock:
+            points = self.get_tiers(interface)[resolution].query(now - range_seconds)
+            generated_points = self.get_tiers(generated)[resolution].query(now - range_seconds) if generated else None
+
+        time_format = "%H:%M:%S" if resolution == "1s" else "%H:%M" if resolution == "1m" else "%m-%d %H:%M"
+        result = {
+            "resolution": resolution,
+            "timestamp": [datetime.fromtimestamp(start).strftime(time_format) for start, _, _ in points],
+            "sent": [round(sent / 1024, 2) for _, _, sent in points],
+            "recv": [round(recv / 1024, 2) for _, recv, _ in points]
+        }
+        if generated_points is not None:
+            generated_recv = {start: recv for start, recv, _ in generated_points}
+            blackhole = [generated_recv.get(start, 0.0) for start, _, _ in points]
+            result["blackhole_recv"] = [round(recv / 1024, 2) for recv in blackhole]
+            result["foreground_recv"] = [round(max(0.0, recv - blackhole_recv) / 1024, 2)
+                                         for (_, recv, _), blackhole_recv in zip(points, blackhole)]
+        return result
+
+    def flush(self):
+        """退出时把映射文件的脏页写回磁盘"""
+        with self.lock:
+            for history_file in self.files.values():
+                try:
+                    history_file.flush()
+                except Exception as e:
+                    self.logger.info(f"流量历史落盘失败: {e}")
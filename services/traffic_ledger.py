@@ -0,0 +1,203 @@
+"""流量账本 - 按小时记录下载字节数的追加式磁盘账本"""
+
+import os
+import time
+import struct
+import calendar
+import threading
+import atexit
+import logging
+from datetime import datetime, date, timedelta
+
+
+# 小时明细记录: (unix小时序号, 增量字节数)
+HOUR_RECORD = struct.Struct('<IQ')
+# 每日汇总记录: (YYYYMMDD, 当日总字节数)
+DAY_RECORD = struct.Struct('<IQ')
+
+
+class TrafficLedger:
+    """流量账本 - 每天一个追加式小时明细文件 + 一个每日汇总文件
+
+    写入先在内存中按小时累加，由后台线程定期批量追加并fsync；
+    跨天时把前一天的总量追加到汇总文件，月度查询只需读汇总。
+    """
+
+    def __init__(self, ledger_dir=None, flush_interval=10, detail_retention_days=62):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.ledger_dir = ledger_dir
+        self.flush_interval = flush_interval
+        self.detail_retention_days = detail_retention_days  # 小时明细保留天数，汇总永久保留
+        self.daily_totals = {}  # {YYYYMMDD: bytes}，不含今天
+        self.pending = {}  # 尚未落盘的 {unix小时: bytes}
+        self.today = None
+        self.today_bytes = 0
+        self.version = 0  # 今日累计或每日汇总每次变化加一，用于HTTP ETag
+        self.loaded = False
+        self.flush_thread = None
+
+    def ensure_loaded(self):
+        """首次使用时加载账本并启动后台落盘线程"""
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            if self.ledger_dir is None:
+                from services.config_service import get_data_dir
+                self.ledger_dir = os.path.join(get_data_dir(), 'traffic_ledger')
+            os.makedirs(self.ledger_dir, exist_ok=True)
+            self.load()
+            self.loaded = True
+
+        self.flush_thread = threading.Thread(target=self.flush_loop, daemon=True)
+        self.flush_thread.start()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def day_key(day):
+        return day.year * 10000 + day.month * 100 + day.day
+
+    def detail_file(self, day_key):
+        return os.path.join(self.ledger_dir, f"{day_key}.hours")
+
+    def summary_file(self):
+        return os.path.join(self.ledger_dir, "daily.totals")
+
+    def read_records(self, path, record):
+        """读取定长记录文件，忽略崩溃时写了一半的尾部记录"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % record.size
+        return [record.unpack_from(data, offset) for offset in range(0, usable, record.size)]
+
+    def load(self):
+        """启动时恢复：读汇总，补齐缺失的汇总，恢复今日总量（需持有锁）"""
+        self.today = date.today()
+        today_key = self.day_key(self.today)
+
+        if os.path.exists(self.summary_file()):
+            for day_key, total in self.read_records(self.summary_file(), DAY_RECORD):
+                self.daily_totals[day_key] = total
+
+        retention_key = self.day_key(self.today - timedelta(days=self.detail_retention_days))
+        for name in sorted(os.listdir(self.ledger_dir)):
+            if not name.endswith('.hours'):
+                continue
+            try:
+                day_key = int(name[:-len('.hours')])
+            except ValueError:
+                continue
+            path = os.path.join(self.ledger_dir, name)
+            if day_key == today_key:
+                self.today_bytes = sum(delta for _, delta in self.read_records(path, HOUR_RECORD))
+            elif day_key not in self.daily_totals:
+                # 上次运行在跨天前退出，补写汇总
+                total = sum(delta for _, delta in self.read_records(path, HOUR_RECORD))
+                self.append_summary(day_key, total)
+            elif day_key < retention_key:
+                os.remove(path)
+
+        self.logger.info(f"流量账本已加载: 今日 {self.today_bytes / 1024 / 1024:.1f} MB, "
+                         f"历史 {len(self.daily_totals)} 天")
+
+    def append_summary(self, day_key, total):
+        """追加一条每日汇总（需持有锁）"""
+        with open(self.summary_file(), 'ab') as f:
+            f.write(DAY_RECORD.pack(day_key, total))
+            f.flush()
+            os.fsync(f.fileno())
+        self.daily_totals[day_key] = total
+
+    def rollover(self, now_day):
+        """跨天：落盘前一天的明细并写入汇总（需持有锁）"""
+        self.write_pending()
+        self.append_summary(self.day_key(self.today), self.today_bytes)
+        self.logger.info(f"流量账本跨天: {self.today} 共 {self.today_bytes / 1024 / 1024 / 1024:.2f} GB")
+        self.today = now_day
+        self.today_bytes = 0
+        self.version += 1
+
+    def add(self, nbytes):
+        """记录下载字节数，返回今日累计"""
+        self.ensure_loaded()
+        now = time.time()
+        with self.lock:
+            now_day = date.fromtimestamp(now)
+            if now_day != self.today:
+                self.rollover(now_day)
+            hour = int(now // 3600)
+            self.pending[hour] = self.pending.get(hour, 0) + nbytes
+            self.today_bytes += nbytes
+            self.version += 1
+            return self.today_bytes
+
+    def write_pending(self):
+        """把内存中的小时增量追加到明细文件并fsync（需持有锁）"""
+        if not self.pending:
+            return
+        records = {}
+        for hour, delta in self.pending.items():
+            day_key = self.day_key(date.fromtimestamp(hour * 3600))
+            records.setdefault(day_key, []).append(HOUR_RECORD.pack(hour, delta))
+        for day_key, packed in records.items():
+            with open(self.detail_file(day_key), 'ab') as f:
+                f.write(b''.join(packed))
+                f.flush()
+                os.fsync(f.fileno())
+        self.pending = {}
+
+    def flush(self):
+        """立即落盘"""
+        if not self.loaded:
+            return
+        with self.lock:
+            try:
+                if date.today() != self.today:
+                    self.rollover(date.today())
+                self.write_pending()
+            except Exception as e:
+                self.logger.info(f"流量账本落盘失败: {e}")
+
+    def flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def get_today_bytes(self):
+        """今日累计字节数（含未落盘部分）"""
+        self.ensure_loaded()
+        with self.lock:
+            if date.today() != self.today:
+                self.rollover(date.today())
+            return self.today_bytes
+
+    def get_month(self, year, month):
+        """按天返回某月的下载量，直接读每日汇总"""
+        self.ensure_loaded()
+        with self.lock:
+            days_in_month = calendar.monthrange(year, month)[1]
+            today_key = self.day_key(self.today)
+            days = []
+            for day in range(1, days_in_month + 1):
+                day_key = year * 10000 + month * 100 + day
+                total = self.today_bytes if day_key == today_key else self.daily_totals.get(day_key, 0)
+                days.append({"day": day, "bytes": total})
+            return days
+
+    def get_day_hours(self, day):
+        """按小时返回某天的下载量（明细保留期内）"""
+        self.ensure_loaded()
+        with self.lock:
+            self.write_pending()
+            hours = [0] * 24
+            path = self.detail_file(self.day_key(day))
+            if os.path.exists(path):
+                for hour, delta in self.read_records(path, HOUR_RECORD):
+                    hours[datetime.fromtimestamp(hour * 3600).hour] += delta
+            return [{"hour": hour, "bytes": total} for hour, total in enumerate(hours)]
+
+
+# 全局实例
+traffic_ledger = TrafficLedger()
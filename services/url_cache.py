@@ -0,0 +1,120 @@
+"""下载源元数据缓存 - 避免每次下载前的HEAD往返"""
+
+import os
+import json
+import time
+import threading
+import logging
+
+
+class UrlMetadataCache:
+    """URL元数据缓存 - TTL过期后用ETag/Last-Modified条件请求重新验证，持久化到磁盘"""
+
+    def __init__(self, cache_file=None, ttl_seconds=3600):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.cache_file = cache_file
+        self.ttl_seconds = ttl_seconds
+        self.entries = {}
+        self.loaded = False
+
+    def set_ttl(self, ttl_seconds):
+        self.ttl_seconds = max(0, ttl_seconds)
+
+    def ensure_loaded(self):
+        """首次使用时从磁盘加载缓存"""
+        if self.loaded:
+            return
+        with self.lock:
+            if self.loaded:
+                return
+            self.loaded = True
+            if self.cache_file is None:
+                from services.config_service import get_data_dir
+                self.cache_file = os.path.join(get_data_dir(), 'url_cache.json')
+            try:
+                if os.path.exists(self.cache_file):
+                    with open(self.cache_file, 'r', encoding='utf-8') as f:
+                        self.entries = json.load(f)
+                    self.logger.info(f"已加载 {len(self.entries)} 条下载源元数据缓存")
+            except Exception as e:
+                self.logger.info(f"加载下载源元数据缓存失败: {e}")
+                self.entries = {}
+
+    def save(self):
+        """原子写入缓存文件（需持有锁）"""
+        try:
+            os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+            temp_file = self.cache_file + '.tmp'
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, indent=2, ensure_ascii=False)
+            os.replace(temp_file, self.cache_file)
+        except Exception as e:
+            self.logger.info(f"保存下载源元数据缓存失败: {e}")
+
+    def get_fresh(self, url):
+        """获取未过期的元数据，过期或不存在时返回None"""
+        self.ensure_loaded()
+        with self.lock:
+            entry = self.entries.get(url)
+            if entry and time.time() - entry.get('fetched_at', 0) < self.ttl_seconds:
+                return dict(entry)
+            return None
+
+    def conditional_headers(self, url):
+        """过期条目的条件请求头，用于重新验证"""
+        self.ensure_loaded()
+        with self.lock:
+            entry = self.entries.get(url)
+            headers = {}
+            if entry:
+                if entry.get('etag'):
+                    headers['If-None-Match'] = entry['etag']
+                elif entry.get('last_modified'):
+                    headers['If-Modified-Since'] = entry['last_modified']
+            return headers
+
+    def store(self, url, status, headers, final_url):
+        """根据HEAD响应更新缓存；304表示元数据未变，仅刷新时间"""
+        self.ensure_loaded()
+        headers = {key.lower(): value for key, value in headers.items()}
+        with self.lock:
+            entry = self.entries.get(url)
+            if status == 304 and entry:
+                entry['fetched_at'] = time.time()
+                entry['revalidations'] = entry.get('revalidations', 0) + 1
+            else:
+                entry = {
+                    "size": int(headers.get('content-length', 0) or 0),
+                    "accept_ranges": headers.get('accept-ranges', '').lower() == 'bytes',
+                    "final_url": final_url or url,
+                    "server": headers.get('server'),
+                    "etag": headers.get('etag'),
+                    "last_modified": headers.get('last-modified'),
+                    "fetched_at": time.time(),
+                    "revalidations": 0
+                }
+                self.entries[url] = entry
+            self.save()
+            return dict(entry)
+
+    def invalidate(self, url):
+        """解析后的地址失效（如签名过期）时删除条目"""
+        self.ensure_loaded()
+        with self.lock:
+            if self.entries.pop(url, None) is not None:
+                self.save()
+
+    def prune(self, urls):
+        """删除已不在配置中的URL"""
+        self.ensure_loaded()
+        with self.lock:
+            stale = [url for url in self.entries if url not in urls]
+            for url in stale:
+                del self.entries[url]
+            if stale:
+                self.save()
+
+
+# 全局实例
+url_cache = UrlMetadataCache()
@@ -0,0 +1,286 @@
+"""计费统计 - 每个网卡的日/月流量总量与5分钟速率的95/99分位数，增量更新，内存固定"""
+
+import os
+import json
+import math
+import atexit
+import threading
+import logging
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+
+
+class RateHistogram:
+    """对数分桶直方图 - 桶宽按1%递增，分位数相对误差不超过1%，内存与样本数无关
+
+    覆盖 1 B/s ~ 12.5 GB/s（100 Gbit/s），低于1 B/s计入第0桶。
+    """
+
+    RATIO = 1.01
+    MAX_RATE = 12.5e9
+    BINS = int(math.log(MAX_RATE) / math.log(RATIO)) + 2
+
+    def __init__(self, counts=None):
+        self.counts = array('I', [0]) * self.BINS
+        self.total = 0
+        self.max_rate = 0.0
+        if counts:
+            self.restore(counts)
+
+    def index(self, rate):
+        if rate < 1.0:
+            return 0
+        return min(self.BINS - 1, int(math.log(rate) / math.log(self.RATIO)) + 1)
+
+    def upper(self, index):
+        """桶的上边界；计费取上边界，宁高勿低"""
+        return 0.0 if index == 0 else self.RATIO ** index
+
+    def add(self, rate):
+        self.counts[self.index(rate)] += 1
+        self.total += 1
+        self.max_rate = max(self.max_rate, rate)
+
+    def quantile(self, q):
+        """第q分位数（0~1），按计费惯例取排序后第 ceil(q*n) 个样本所在的桶"""
+        if not self.total:
+            return 0.0
+        rank = max(1, math.ceil(q * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(self.upper(index), self.max_rate)
+        return self.max_rate
+
+    def to_dict(self):
+        """稀疏保存非零桶"""
+        return {"max": self.max_rate,
+                "counts": {str(index): count for index, count in enumerate(self.counts) if count}}
+
+    def restore(self, data):
+        self.max_rate = data.get("max", 0.0)
+        for index, count in data.get("counts", {}).items():
+            index = int(index)
+            if 0 <= index < self.BINS:
+                self.counts[index] = count
+                self.total += count
+
+
+class InterfaceUsage:
+    """单个网卡的计费统计 - 当前5分钟桶、当日/当月总量、当月5分钟速率直方图
+
+    分位数在每个5分钟桶结束时重新计算并缓存，查询只读取缓存值。
+    没有完整采样的桶（启动时所在的桶、重启前保存的未结束的桶）只计入日/月总量，
+    不计入速率直方图：停机期间的流量没有采到，按整桶平均会得到偏低的速率样本。
+    """
+
+    def __init__(self, bucket_seconds, keep_days, keep_months):
+        self.bucket_seconds = bucket_seconds
+        self.keep_days = keep_days
+        self.keep_months = keep_months
+        self.bucket_start = None
+        self.bucket_recv = 0
+        self.bucket_sent = 0
+        self.bucket_partial = True  # 当前桶缺少部分时间的样本，结束时不计入直方图
+        self.sampling = False  # 本次运行是否已收到样本
+        self.day = None  # YYYY-MM-DD
+        self.month = None  # YYYY-MM
+        self.day_recv = self.day_sent = 0
+        self.month_recv = self.month_sent = 0
+        self.days = OrderedDict()  # 已结束的天 {日期: [接收, 发送]}，只保留最近keep_days天
+        self.months = OrderedDict()  # 已结束的月 {月份: {...}}，只保留最近keep_months个月
+        self.recv_hist = RateHistogram()
+        self.sent_hist = RateHistogram()
+        self.percentiles = self.compute_percentiles()
+
+    def compute_percentiles(self):
+        """当月5分钟平均速率的分位数 (字节/秒)"""
+        return {
+            "samples": self.recv_hist.total,
+            "recv_p95": self.recv_hist.quantile(0.95),
+            "recv_p99": self.recv_hist.quantile(0.99),
+            "recv_max": self.recv_hist.max_rate,
+            "sent_p95": self.sent_hist.quantile(0.95),
+            "sent_p99": self.sent_hist.quantile(0.99),
+            "sent_max": self.sent_hist.max_rate
+        }
+
+    def add(self, timestamp, recv_bytes, sent_bytes):
+        """累加一次采样的增量；返回是否结束了一个5分钟桶"""
+        bucket = timestamp - timestamp % self.bucket_seconds
+        committed = False
+        if self.bucket_start is not None and bucket != self.bucket_start:
+            self.commit_bucket()
+            committed = True
+        if self.bucket_start is None:
+            self.bucket_start = bucket
+            # 本次运行的第一个样本所在的桶缺少启动之前的部分
+            self.bucket_partial = not self.sampling
+        self.sampling = True
+
+        now = datetime.fromtimestamp(timestamp)
+        day = now.strftime("%Y-%m-%d")
+        month = now.strftime("%Y-%m")
+        if day != self.day:
+            self.rollover_day(day)
+        if month != self.month:
+            self.rollover_month(month)
+
+        self.bucket_recv += recv_bytes
+        self.bucket_sent += sent_bytes
+        self.day_recv += recv_bytes
+        self.day_sent += sent_bytes
+        self.month_recv += recv_bytes
+        self.month_sent += sent_bytes
+        return committed
+
+    def commit_bucket(self):
+        """5分钟桶结束：平均速率计入直方图（在跨月之前提交，桶归属于其开始时间所在的月）"""
+        if not self.bucket_partial:
+            self.recv_hist.add(self.bucket_recv / self.bucket_seconds)
+            self.sent_hist.add(self.bucket_sent / self.bucket_seconds)
+            self.percentiles = self.compute_percentiles()
+        self.bucket_partial = False
+        self.bucket_start = None
+        self.bucket_recv = 0
+        self.bucket_sent = 0
+
+    def rollover_day(self, day):
+        if self.day is not None:
+            self.days[self.day] = [self.day_recv, self.day_sent]
+            while len(self.days) > self.keep_days:
+                self.days.popitem(last=False)
+        self.day = day
+        self.day_recv = self.day_sent = 0
+
+    def rollover_month(self, month):
+        """跨月：保存上月总量和分位数，直方图清零"""
+        if self.month is not None:
+            self.months[self.month] = dict(self.percentiles, recv_bytes=self.month_recv, sent_bytes=self.month_sent)
+            while len(self.months) > self.keep_months:
+                self.months.popitem(last=False)
+        self.month = month
+        self.month_recv = self.month_sent = 0
+        self.recv_hist = RateHistogram()
+        self.sent_hist = RateHistogram()
+        self.percentiles = self.compute_percentiles()
+
+    def summary(self):
+        """接口返回格式：字节数与字节/秒，不做单位换算"""
+        return {
+            "day": {"date": self.day, "recv_bytes": self.day_recv, "sent_bytes": self.day_sent},
+            "month": dict(self.percentiles, month=self.month, recv_bytes=self.month_recv, sent_bytes=self.month_sent),
+            "days": [{"date": day, "recv_bytes": recv, "sent_bytes": sent} for day, (recv, sent) in self.days.items()],
+            "months": [dict(values, month=month) for month, values in self.months.items()]
+        }
+
+    def to_dict(self):
+        return {
+            "bucket": [self.bucket_start, self.bucket_recv, self.bucket_sent],
+            "day": [self.day, self.day_recv, self.day_sent],
+            "month": [self.month, self.month_recv, self.month_sent],
+            "days": list(self.days.items()),
+            "months": list(self.months.items()),
+            "recv_hist": self.recv_hist.to_dict(),
+            "sent_hist": self.sent_hist.to_dict()
+        }
+
+    def restore(self, data):
+        """恢复保存的统计；未结束的桶跨越了停机时间，结束时丢弃其速率样本（字节仍计入日/月总量）"""
+        self.bucket_start, self.bucket_recv, self.bucket_sent = data["bucket"]
+        self.bucket_partial = True
+        self.day, self.day_recv, self.day_sent = data["day"]
+        self.month, self.month_recv, self.month_sent = data["month"]
+        self.days = OrderedDict((day, list(values)) for day, values in data.get("days", []))
+        self.months = OrderedDict((month, values) for month, values in data.get("months", []))
+        self.recv_hist = RateHistogram(data.get("recv_hist"))
+        self.sent_hist = RateHistogram(data.get("sent_hist"))
+        self.percentiles = self.compute_percentiles()
+
+
+class UsageAggregator:
+    """计费统计聚合器 - 作为网卡采样器的增量消费者，每个样本O(1)更新
+
+    上游按5分钟平均速率的95分位和月度总量计费；这里按本地时间的自然日/自然月统计。
+    状态在每个5分钟桶结束时写入 data/usage_stats.json（先写临时文件再替换），重启后继续累计。
+    """
+
+    def __init__(self, state_file=None, bucket_seconds=300, keep_days=62, keep_months=24):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.state_file = state_file
+        self.bucket_seconds = bucket_seconds
+        self.keep_days = keep_days
+        self.keep_months = keep_months
+        self.usage = {}  # {网卡: InterfaceUsage}
+        self.loaded = False
+        self.dirty = False  # 有已结束的5分钟桶尚未保存
+        atexit.register(self.save)
+
+    def get_state_file(self):
+        if self.state_file is None:
+            from services.config_service import get_data_dir
+            self.state_file = os.path.join(get_data_dir(), 'usage_stats.json')
+        return self.state_file
+
+    def ensure_loaded(self):
+        """首次使用时恢复上次保存的统计（需持有锁）"""
+        if self.loaded:
+            return
+        self.loaded = True
+        try:
+            state_file = self.get_state_file()
+            if not os.path.exists(state_file):
+                return
+            with open(state_file, 'r') as f:
+                saved = json.load(f)
+            for interface, data in saved.get("interfaces", {}).items():
+                usage = InterfaceUsage(self.bucket_seconds, self.keep_days, self.keep_months)
+                usage.restore(data)
+                self.usage[interface] = usage
+            self.logger.info(f"计费统计已加载: {len(self.usage)} 个网卡")
+        except Exception as e:
+            self.logger.info(f"加载计费统计失败，重新开始统计: {e}")
+            self.usage = {}
+
+    def add(self, interface, timestamp, recv_bytes, sent_bytes):
+        """记录一次采样间隔内的增量字节数（采样器回调）"""
+        with self.lock:
+            self.ensure_loaded()
+            usage = self.usage.get(interface)
+            if usage is None:
+                usage = self.usage[interface] = InterfaceUsage(self.bucket_seconds, self.keep_days, self.keep_months)
+            if usage.add(int(timestamp), recv_bytes, sent_bytes):
+                self.dirty = True
+
+    def on_tick(self):
+        """采样节拍回调（采样器锁外）：有5分钟桶结束时保存状态"""
+        if self.dirty:
+            self.dirty = False
+            self.save()
+
+    def save(self):
+        """在锁内生成快照，锁外写文件，不阻塞采样线程"""
+        with self.lock:
+            if not self.usage:
+                return
+            state = {"interfaces": {interface: usage.to_dict() for interface, usage in self.usage.items()}}
+        with self.save_lock:
+            try:
+                state_file = self.get_state_file()
+                temp_file = state_file + '.tmp'
+                with open(temp_file, 'w') as f:
+                    json.dump(state, f)
+                os.replace(temp_file, state_file)
+            except Exception as e:
+                self.logger.info(f"保存计费统计失败: {e}")
+
+    def get_usage(self, interface):
+        """网卡的计费统计，尚无数据时返回None"""
+        with self.lock:
+            self.ensure_loaded()
+            usage = self.usage.get(interface)
+            return usage.summary() if usage is not None else None
@@ -0,0 +1,125 @@
+"""生产环境HTTP服务 - 固定大小线程池的WSGI服务器，支持超时、背压和优雅关闭
+
+只依赖Flask自带的Werkzeug和标准库：
+- 接受连接的线程只负责把连接放入有界队列，由固定数量的工作线程处理，线程数不随访问量增长
+- 队列已满时直接返回503（背压），不会无限排队拖垮下载线程
+- 单个请求读写超时为request_timeout；不支持keep-alive，Werkzeug的请求处理器在每个响应后读尽套接字中的剩余数据
+  并发送 Connection: close，每个连接只处理一个请求
+- 收到SIGTERM/SIGINT后停止接受连接，结束推送流，等待处理中的请求完成，再停止后台服务
+"""
+
+import queue
+import signal
+import threading
+import time
+import logging
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from services.log_pipeline import rate_limited
+
+
+class PooledRequestHandler(WSGIRequestHandler):
+    """请求处理器 - 按服务器的request_timeout限制单个请求的读写时间"""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # StreamRequestHandler按timeout设置套接字超时
+        self.timeout = self.server.request_timeout
+        super().setup()
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """固定线程池WSGI服务器"""
+
+    multithread = True
+
+    def __init__(self, host, port, app, workers=16, queue_size=64, request_timeout=30):
+        self.logger = logging.getLogger(__name__)
+        self.request_queue_size = queue_size  # 监听backlog，与等待队列一致
+        self.request_timeout = request_timeout
+        super().__init__(host, port, app, handler=PooledRequestHandler)
+        self.connections = queue.Queue(maxsize=queue_size)
+        self.workers = []
+        for index in range(workers):
+            thread = threading.Thread(target=self.work, name=f"http-worker-{index}", daemon=True)
+            thread.start()
+            self.workers.append(thread)
+
+    def process_request(self, request, client_address):
+        """接受线程：放入等待队列，队列已满时拒绝"""
+        try:
+            self.connections.put_nowait((request, client_address))
+        except queue.Full:
+            self.reject(request)
+
+    def reject(self, request):
+        self.logger.info("HTTP等待队列已满，返回503", extra=rate_limited(10))
+        try:
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                            b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def work(self):
+        """工作线程：逐个处理连接"""
+        while True:
+            item = self.connections.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def stop_workers(self, timeout):
+        """等待处理中的请求完成，最多timeout秒"""
+        deadline = time.monotonic() + timeout
+        for _ in self.workers:
+            try:
+                self.connections.put(None, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self.workers:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        busy = sum(1 for thread in self.workers if thread.is_alive())
+        if busy:
+            self.logger.info(f"{busy} 个HTTP工作线程 {timeout} 秒内未完成，放弃等待")
+
+
+def serve(app, host, port, workers=16, queue_size=64, request_timeout=30,
+          drain_timeout=10, on_stopping=None, on_shutdown=None):
+    """运行服务器直到收到SIGTERM/SIGINT
+
+    on_stopping: 停止接受连接后立即调用（如结束长连接推送流，释放工作线程）
+    on_shutdown: 处理中的请求完成后调用（如停止下载和采样线程）
+    """
+    logger = logging.getLogger(__name__)
+    server = PooledWSGIServer(host, port, app, workers=workers, queue_size=queue_size,
+                              request_timeout=request_timeout)
+
+    def handle_signal(signum, frame):
+        logger.info(f"收到信号 {signal.Signals(signum).name}，开始关闭")
+        # shutdown()会等待serve_forever退出，不能在运行serve_forever的主线程中直接调用
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logger.info(f"HTTP服务: {workers} 个工作线程，等待队列 {queue_size}，"
+                f"请求超时 {request_timeout} 秒")
+    try:
+        server.serve_forever(poll_interval=0.5)
+    finally:
+        if on_stopping is not None:
+            on_stopping()
+        server.stop_workers(drain_timeout)
+        server.server_close()
+        if on_shutdown is not None:
+            on_shutdown()
+        logger.info("HTTP服务已关闭")
@@ -11,10 +11,12 @@ const ConfigModule = {
         "schedule_end": "23:59",
         "sleep_min_minutes": 10,
         "sleep_max_minutes": 20,
+        "concurrency": 4,
         "urls": []
     },
     isInitialized: false,
     notificationTimer: null,
+    writeCheckTimer: null,
 
     /**
      * 初始化配置模块
@@ -121,6 +123,7 @@ const ConfigModule = {
             schedule_end: "23:59",
             sleep_min_minutes: 10,
             sleep_max_minutes: 20,
+            concurrency: 4,
             urls: []
         };
         
@@ -152,7 +155,8 @@ const ConfigModule = {
             'schedule_start': 'schedule-start',
             'schedule_end': 'schedule-end',
             'sleep_min_minutes': 'sleep-min',
-            'sleep_max_minutes': 'sleep-max'
+            'sleep_max_minutes': 'sleep-max',
+            'concurrency': 'concurrency'
         };
         return fieldMap[configKey] || configKey;
     },
@@ -182,7 +186,9 @@ const ConfigModule = {
             })
             .then(config => {
                 console.log('加载配置成功:', config);
+                this.reportWriteError(config);
                 this.config = {...config};
+                delete this.config.write_error;
                 // 更新URL列表显示
                 this.updateURLList();
                 return this.config;
@@ -211,6 +217,7 @@ const ConfigModule = {
                 schedule_end: document.getElementById('schedule-end').value || '23:59',
                 sleep_min_minutes: parseInt(document.getElementById('sleep-min').value) || 10,
                 sleep_max_minutes: parseInt(document.getElementById('sleep-max').value) || 20,
+                concurrency: parseInt(document.getElementById('concurrency').value) || 4,
                 urls: []
             };
             
@@ -242,6 +249,7 @@ const ConfigModule = {
                 console.log('配置保存成功:', result);
                 this.config = config;
                 this.showNotification('配置已保存', 'success');
+                this.scheduleWriteCheck();
                 return result;
             })
             .catch(error => {
@@ -256,6 +264,35 @@ const ConfigModule = {
         }
     },
 
+    /**
+     * 配置文件在保存后延迟写入（最多约3秒），稍后重新获取配置，写入失败时提示
+     */
+    scheduleWriteCheck() {
+        if (this.writeCheckTimer) {
+            clearTimeout(this.writeCheckTimer);
+        }
+        this.writeCheckTimer = setTimeout(() => {
+            this.writeCheckTimer = null;
+            fetch('/api/downonly/config')
+                .then(response => response.ok ? response.json() : null)
+                .then(config => {
+                    if (config) {
+                        this.reportWriteError(config);
+                    }
+                })
+                .catch(error => console.error('检查配置写入结果失败:', error));
+        }, 4000);
+    },
+
+    /**
+     * 配置文件写入失败（如磁盘已满）时提示，内存中的配置已生效但重启后会丢失
+     */
+    reportWriteError(config) {
+        if (config.write_error) {
+            this.showNotification('配置已生效，但写入配置文件失败: ' + config.write_error, 'error');
+        }
+    },
+
     /**
      * 添加URL - 修复版本
      */
@@ -0,0 +1,87 @@
+/**
+ * 实时推送模块 - 通过 Server-Sent Events 接收网卡统计和流量黑洞状态
+ *
+ * 所有模块共用一个 EventSource 连接；连接不可用时各模块退回定时轮询。
+ */
+
+const LiveEvents = {
+    source: null,
+    connected: false,
+    handlers: {},
+    stateHandlers: [],
+    downonlyStatus: {},
+
+    /**
+     * 建立连接（重复调用只建立一次）
+     */
+    connect() {
+        if (this.source || typeof EventSource === 'undefined') {
+            return;
+        }
+
+        this.source = new EventSource('/api/events');
+
+        this.source.onopen = () => {
+            console.log('实时推送已连接');
+            this.setConnected(true);
+        };
+
+        this.source.onerror = () => {
+            // 浏览器会按服务器指定的间隔自动重连，期间由各模块轮询
+            console.warn('实时推送连接中断，暂时改为轮询');
+            this.setConnected(false);
+        };
+
+        this.source.addEventListener('stats', (event) => {
+            this.dispatch('stats', JSON.parse(event.data));
+        });
+
+        this.source.addEventListener('downonly', (event) => {
+            // 服务器只推送变化的字段，合并后再分发完整状态
+            const delta = JSON.parse(event.data);
+            Object.keys(delta).forEach(key => {
+                if (delta[key] === null) {
+                    delete this.downonlyStatus[key];
+                } else {
+                    this.downonlyStatus[key] = delta[key];
+                }
+            });
+            this.dispatch('downonly', Object.assign({}, this.downonlyStatus));
+        });
+    },
+
+    /**
+     * 订阅事件: stats / downonly
+     */
+    on(event, handler) {
+        if (!this.handlers[event]) {
+            this.handlers[event] = [];
+        }
+        this.handlers[event].push(handler);
+    },
+
+    /**
+     * 订阅连接状态变化，回调参数为是否已连接
+     */
+    onStateChange(handler) {
+        this.stateHandlers.push(handler);
+    },
+
+    dispatch(event, data) {
+        (this.handlers[event] || []).forEach(handler => {
+            try {
+                handler(data);
+            } catch (error) {
+                console.error(`处理实时事件 ${event} 失败:`, error);
+            }
+        });
+    },
+
+    setConnected(connected) {
+        if (this.connected === connected) {
+            return;
+        }
+        this.connected = connected;
+        this.stateHandlers.forEach(handler => handler(connected));
+    }
+};
@@ -14,7 +14,9 @@ const MonitorModule = {
     currentStats: { sent_rate: 0, recv_rate: 0, total_sent: 0, total_recv: 0 },
     updateTimer: null,
     chartTimer: null,
+    lastChartUpdate: 0,
     isInitialized: false,
+    liveBound: false,
 
     /**
      * 初始化
@@ -181,15 +183,50 @@ const MonitorModule = {
      * 启动定时器
      */
     startTimers() {
-        // 每秒更新统计数据
-        this.updateTimer = setInterval(() => this.updateStats(), 1000);
-        
-        // 每2秒更新图表（加快刷新频率）
-        this.chartTimer = setInterval(() => this.updateChartRealtime(), 2000);
-        
+        // 统计数据和图表由实时推送更新，推送不可用时轮询（统计每秒，图表每2秒）
+        this.bindLiveEvents();
+        this.setPolling(!LiveEvents.connected);
+
         console.log('Timers started');
     },
 
+    /**
+     * 订阅实时推送（只订阅一次）
+     */
+    bindLiveEvents() {
+        if (this.liveBound) return;
+        this.liveBound = true;
+
+        LiveEvents.on('stats', (data) => {
+            const stats = data.interfaces && data.interfaces[this.currentInterface];
+            if (stats && !stats.error) {
+                this.applyStats(stats);
+                // 推送每秒一次，图表保持每2秒一个点
+                if (Date.now() - this.lastChartUpdate >= 2000) this.updateChartRealtime();
+            }
+        });
+        LiveEvents.onStateChange((connected) => this.setPolling(!connected));
+        LiveEvents.connect();
+    },
+
+    /**
+     * 开启/关闭轮询（统计每秒，图表每2秒）
+     */
+    setPolling(enabled) {
+        if (this.updateTimer) {
+            clearInterval(this.updateTimer);
+            this.updateTimer = null;
+        }
+        if (this.chartTimer) {
+            clearInterval(this.chartTimer);
+            this.chartTimer = null;
+        }
+        if (enabled) {
+            this.updateTimer = setInterval(() => this.updateStats(), 1000);
+            this.chartTimer = setInterval(() => this.updateChartRealtime(), 2000);
+        }
+    },
+
     /**
      * 加载初始历史数据
      */
@@ -318,25 +355,30 @@ const MonitorModule = {
                 return;
             }
 
-            this.currentStats = data;
-            
-            // 更新DOM
-            const totalSentEl = document.getElementById('total-sent');
-            const totalRecvEl = document.getElementById('total-recv');
-            const sentRateEl = document.getElementById('sent-rate');
-            const recvRateEl = document.getElementById('recv-rate');
-            
-            if (totalSentEl) totalSentEl.textContent = data.total_sent.toFixed(2);
-            if (totalRecvEl) totalRecvEl.textContent = data.total_recv.toFixed(2);
-            if (sentRateEl) sentRateEl.textContent = data.sent_rate.toFixed(2);
-            if (recvRateEl) recvRateEl.textContent = data.recv_rate.toFixed(2);
-            
-            console.log('Stats updated:', data);
+            this.applyStats(data);
         } catch (error) {
             console.error('更新统计失败:', error);
         }
     },
 
+    /**
+     * 显示统计数据（轮询和实时推送共用）
+     */
+    applyStats(data) {
+        this.currentStats = data;
+
+        // 更新DOM
+        const totalSentEl = document.getElementById('total-sent');
+        const totalRecvEl = document.getElementById('total-recv');
+        const sentRateEl = document.getElementById('sent-rate');
+        const recvRateEl = document.getElementById('recv-rate');
+
+        if (totalSentEl) totalSentEl.textContent = data.total_sent.toFixed(2);
+        if (totalRecvEl) totalRecvEl.textContent = data.total_recv.toFixed(2);
+        if (sentRateEl) sentRateEl.textContent = data.sent_rate.toFixed(2);
+        if (recvRateEl) recvRateEl.textContent = data.recv_rate.toFixed(2);
+    },
+
     /**
      * 更新图表（每2秒）
      */
@@ -345,6 +387,7 @@ const MonitorModule = {
             return;
         }
 
+        this.lastChartUpdate = Date.now();
         const timeStr = Utils.getCurrentTime();
         const sentRate = parseFloat((this.currentStats.sent_rate || 0).toFixed(2));
         const recvRate = parseFloat((this.currentStats.recv_rate || 0).toFixed(2));
@@ -390,8 +433,7 @@ const MonitorModule = {
      * 销毁
      */
     destroy() {
-        if (this.updateTimer) clearInterval(this.updateTimer);
-        if (this.chartTimer) clearInterval(this.chartTimer);
+        this.setPolling(false);
         if (this.chart) this.chart.dispose();
     },
 
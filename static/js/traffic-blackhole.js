@@ -6,6 +6,7 @@ const TrafficBlackHoleModule = {
     charts: {},
     updateTimers: [],
     isRunning: false,
+    liveBound: false,
     selectedInterface: null,
     lastSpeed: 0,
     speedData: [],
@@ -112,6 +113,13 @@ const TrafficBlackHoleModule = {
         }
         this.updateServiceStatus();
         
+        // 状态由实时推送更新，推送不可用时才定时轮询
+        this.bindLiveEvents();
+        if (LiveEvents.connected) {
+            console.log('流量黑洞使用实时推送，不启动轮询');
+            return;
+        }
+        
         // 定时更新数据 (每2秒) - 无论是否运行都更新，这样才能显示数据
         this.updateTimers.push(setInterval(() => {
             this.updateDataCards();
@@ -125,6 +133,27 @@ const TrafficBlackHoleModule = {
         console.log('流量黑洞定时器启动完成，数量:', this.updateTimers.length);
     },
 
+    /**
+     * 订阅实时推送（只订阅一次）
+     */
+    bindLiveEvents() {
+        if (this.liveBound) return;
+        this.liveBound = true;
+
+        LiveEvents.on('downonly', (data) => {
+            this.isRunning = data.is_running;
+            this.updateUI(data);
+        });
+        LiveEvents.onStateChange((connected) => {
+            if (connected) {
+                this.stopTimers();
+            } else {
+                this.startTimers();
+            }
+        });
+        LiveEvents.connect();
+    },
+
     /**
      * 停止定时器
      */
@@ -153,9 +182,9 @@ const TrafficBlackHoleModule = {
     },
 
     /**
-     * 更新UI界面
+     * 更新UI界面，传入状态数据时直接显示，否则重新获取
      */
-    updateUI() {
+    updateUI(data) {
         console.log('更新流量黑洞UI...');
         
         // 更新按钮状态
@@ -175,7 +204,11 @@ const TrafficBlackHoleModule = {
         }
         
         // 更新数据卡片
-        this.updateDataCards();
+        if (data) {
+            this.renderDataCards(data);
+        } else {
+            this.updateDataCards();
+        }
     },
 
     /**
@@ -189,63 +222,12 @@ const TrafficBlackHoleModule = {
             .then(response => response.json())
             .then(data => {
                 console.log('获取到状态数据:', data);
-                
-                // 更新当前速度卡片（将Mbps转换为KB/s）
-                const speedCard = document.getElementById('currentSpeed');
-                if (speedCard) {
-                    const currentSpeedMbps = data.speed_mbps || 0;
-                    const currentSpeedKBps = currentSpeedMbps * 125; // Mbps to KB/s: 1 Mbps = 1000/8 = 125 KB/s
-                    speedCard.textContent = `${currentSpeedKBps.toFixed(2)}`;
-                    this.lastSpeed = currentSpeedMbps;
-                }
-                
-                // 更新今日流量卡片
-                const usageCard = document.getElementById('todayUsage');
-                if (usageCard) {
-                    const gbUsed = (data.today_bytes / (1024 * 1024 * 1024)).toFixed(2);
-                    usageCard.textContent = `${gbUsed} GB`;
-                }
-                
-                // 更新配额输入框 - 修复配额不能自定义的问题
-                const quotaInput = document.getElementById('daily-quota-input');
-                if (quotaInput) {
-                    // 如果用户修改了配额，不自动覆盖
-                    if (quotaInput.dataset.userModified === 'true') {
-                        console.log('用户已修改配额，保持用户值:', quotaInput.value);
-                    } else {
-                        // 只有在配额有值时才更新
-                        if (data.today_quota_bytes && data.today_quota_bytes > 0) {
-                            const quotaGB = Math.floor(data.today_quota_bytes / (1024 * 1024 * 1024));
-                            // 只有当配额框是空值或者默认值时才更新
-                            if (!quotaInput.value || quotaInput.value === '150') {
-                                quotaInput.value = quotaGB;
-                            }
-                        }
-                    }
-                }
-                
-                // 更新配额百分比卡片
-                const quotaPercentCard = document.getElementById('usagePercent');
-                if (quotaPercentCard) {
-                    const gbUsed = data.today_bytes / (1024 * 1024 * 1024);
-                    const quotaInput = document.getElementById('daily-quota-input');
-                    const gbTotal = quotaInput ? parseInt(quotaInput.value) || 150 : 150;
-                    const percent = gbTotal > 0 ? (gbUsed / gbTotal * 100).toFixed(1) : '0';
-                    quotaPercentCard.textContent = `${percent}%`;
-                }
-                
-                // 更新运行时间卡片
-                const uptimeCard = document.getElementById('uptimeSeconds');
-                if (uptimeCard) {
-                    const uptimeHours = Math.floor(data.uptime_seconds / 3600);
-                    const uptimeMinutes = Math.floor((data.uptime_seconds % 3600) / 60);
-                    const uptimeSeconds = data.uptime_seconds % 60;
-                    uptimeCard.textContent = `${uptimeHours}h ${uptimeMinutes}m ${uptimeSeconds}s`;
-                }
+                this.renderDataCards(data);
             })
             .catch(error => {
                 console.error('更新流量数据卡片失败:', error);
                 // 使用默认值
+                const speedCard = document.getElementById('currentSpeed');
                 if (speedCard) {
                     speedCard.textContent = '0.00';
                 }
@@ -254,6 +236,64 @@ const TrafficBlackHoleModule = {
         console.log('流量黑洞数据卡片更新完成');
     },
 
+    /**
+     * 显示数据卡片（轮询和实时推送共用）
+     */
+    renderDataCards(data) {
+        // 更新当前速度卡片（将Mbps转换为KB/s）
+        const speedCard = document.getElementById('currentSpeed');
+        if (speedCard) {
+            const currentSpeedMbps = data.speed_mbps || 0;
+            const currentSpeedKBps = currentSpeedMbps * 125; // Mbps to KB/s: 1 Mbps = 1000/8 = 125 KB/s
+            speedCard.textContent = `${currentSpeedKBps.toFixed(2)}`;
+            this.lastSpeed = currentSpeedMbps;
+        }
+        
+        // 更新今日流量卡片
+        const usageCard = document.getElementById('todayUsage');
+        if (usageCard) {
+            const gbUsed = (data.today_bytes / (1024 * 1024 * 1024)).toFixed(2);
+            usageCard.textContent = `${gbUsed} GB`;
+        }
+        
+        // 更新配额输入框 - 修复配额不能自定义的问题
+        const quotaInput = document.getElementById('daily-quota-input');
+        if (quotaInput) {
+            // 如果用户修改了配额，不自动覆盖
+            if (quotaInput.dataset.userModified === 'true') {
+                console.log('用户已修改配额，保持用户值:', quotaInput.value);
+            } else {
+                // 只有在配额有值时才更新
+                if (data.today_quota_bytes && data.today_quota_bytes > 0) {
+                    const quotaGB = Math.floor(data.today_quota_bytes / (1024 * 1024 * 1024));
+                    // 只有当配额框是空值或者默认值时才更新
+                    if (!quotaInput.value || quotaInput.value === '150') {
+                        quotaInput.value = quotaGB;
+                    }
+                }
+            }
+        }
+        
+        // 更新配额百分比卡片
+        const quotaPercentCard = document.getElementById('usagePercent');
+        if (quotaPercentCard) {
+            const gbUsed = data.today_bytes / (1024 * 1024 * 1024);
+            const quotaInput = document.getElementById('daily-quota-input');
+            const gbTotal = quotaInput ? parseInt(quotaInput.value) || 150 : 150;
+            const percent = gbTotal > 0 ? (gbUsed / gbTotal * 100).toFixed(1) : '0';
+            quotaPercentCard.textContent = `${percent}%`;
+        }
+        
+        // 更新运行时间卡片
+        const uptimeCard = document.getElementById('uptimeSeconds');
+        if (uptimeCard) {
+            const uptimeHours = Math.floor(data.uptime_seconds / 3600);
+            const uptimeMinutes = Math.floor((data.uptime_seconds % 3600) / 60);
+            const uptimeSeconds = data.uptime_seconds % 60;
+            uptimeCard.textContent = `${uptimeHours}h ${uptimeMinutes}m ${uptimeSeconds}s`;
+        }
+    },
+
     /**
      * 切换服务状态
      */